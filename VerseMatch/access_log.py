@@ -0,0 +1,172 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Write a log of the requests that a server answers in the background.
+
+Handler threads only put a record of each request on a queue, and a single
+writer thread formats the records and writes them out in batches. Records
+may be sampled to keep busy servers from logging every request they get."""
+
+import atexit
+import datetime
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Public Names
+__all__ = (
+    'AccessLog',
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+
+class AccessLog:
+    """Queue records of requests and write them from a separate thread.
+
+    A record is a dictionary describing one request. Only a sample of the
+    successful requests is written if sample is less than one, but errors
+    are always kept. The records are written as lines of JSON if structured
+    is true and in the style of BaseHTTPRequestHandler's log otherwise.
+    The writer waits up to interval seconds for a batch to fill up."""
+
+    PHASES = 'total', 'service', 'render', 'send'  # Latencies recorded.
+
+    def __init__(self, stream=None, sample=1.0, structured=False,
+                 batch_size=256, interval=1.0):
+        """Initialize the log without starting its writer thread yet.
+
+        The thread is started by the first record so that every process a
+        server forks gets a writer of its own. The writer is stopped when the
+        program exits, and then any records left on the queue are written.
+        The stream defaults to stderr."""
+        self.__stream = stream
+        self.__sample = sample
+        self.__structured = structured
+        self.__batch_size = batch_size
+        self.__interval = interval
+        self.__queue = queue.SimpleQueue()
+        self.__mutex = threading.Lock()
+        self.__writing = threading.Lock()
+        self.__pid = self.__thread = None
+        self.__dropped = 0
+        atexit.register(self.close)
+
+    def __reduce__(self):
+        """Pickle the options of the log without its queue or its threads.
+
+        Processes that are spawned instead of forked get a log of their own
+        with the same settings, which writes to stderr if given no stream."""
+        return type(self), (self.__stream, self.__sample, self.__structured,
+                            self.__batch_size, self.__interval)
+
+    def log(self, record):
+        """Queue the record to be written unless it is left out of the sample.
+
+        Records should have time, client, request, status, and size keys,
+        and they may have the latency in seconds for each of the PHASES.
+        Chunked responses are marked by a chunked key that is set to true."""
+        if record['status'] < 400 and self.__sample < 1 and \
+                random.random() >= self.__sample:
+            with self.__mutex:
+                self.__dropped += 1
+            return
+        if self.__pid != os.getpid():
+            self.__start()
+        self.__queue.put(record)
+
+    @property
+    def dropped(self):
+        """Read-only property giving how many records were not sampled."""
+        return self.__dropped
+
+    def __start(self):
+        """Start a writer thread for the process if it does not have one."""
+        with self.__mutex:
+            if self.__pid != os.getpid():
+                self.__thread = threading.Thread(target=self.__run,
+                                                 daemon=True)
+                self.__thread.start()
+                self.__pid = os.getpid()
+
+    def __run(self):
+        """Write batches of records until None is found on the queue."""
+        while True:
+            record = self.__queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = time.monotonic() + self.__interval
+            while len(batch) < self.__batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self.__queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is None:
+                    self.__write(batch)
+                    return
+                batch.append(record)
+            self.__write(batch)
+
+    def close(self, timeout=5):
+        """Stop the writer thread and then write the records left over.
+
+        The thread is given up to timeout seconds to finish the batch that
+        it is writing, so that no record is written twice or out of order."""
+        with self.__mutex:
+            thread = self.__thread if self.__pid == os.getpid() else None
+            self.__thread = None
+        if thread is not None and thread.is_alive():
+            self.__queue.put(None)
+            thread.join(timeout)
+        self.flush()
+
+    def flush(self):
+        """Write every record that is waiting on the queue right now."""
+        batch = []
+        while True:
+            try:
+                record = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                batch.append(record)
+        if batch:
+            self.__write(batch)
+
+    def __write(self, batch):
+        """Format the records and write them to the stream all at once."""
+        text = ''.join(map(self.__format, batch))
+        stream = sys.stderr if self.__stream is None else self.__stream
+        with self.__writing:
+            try:
+                stream.write(text)
+                stream.flush()
+            except (OSError, ValueError):
+                pass    # The stream is gone, so the records are lost.
+
+    def __format(self, record):
+        """Turn a record into a line of JSON or of readable text."""
+        if self.__structured:
+            return json.dumps(record, separators=(',', ':')) + '\n'
+        stamp = time.localtime(record['time'])
+        line = (f'{record["client"]} - - '
+                f'[{time.strftime("%d/%b/%Y %H:%M:%S", stamp)}] '
+                f'"{record["request"]}" {record["status"]} '
+                f'{record["size"] if record["size"] is not None else "-"}')
+        for phase in self.PHASES:
+            if record.get(phase) is not None:
+                line += f' {phase}={record[phase] * 1000:.3f}ms'
+        if record.get('chunked'):
+            line += ' chunked'
+        return line + '\n'
@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Define the SQL shared by the Bible server and the database builder.
+
+BibleServer runs these queries, and database/build.py plans them and fills
+in the full-text index that the search query joins back to the verses."""
+
+import datetime
+
+# Public Names
+__all__ = (
+    'SEARCH_KEY',
+    'CHAPTER',
+    'VERSE',
+    'RANGE',
+    'SEARCH'
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+# Symbolic Constants
+SEARCH_KEY = 1000000, 1000  # Multiply book and chapter to number rows.
+CHAPTER = '''\
+SELECT verse,
+       content
+  FROM bible
+ WHERE book = ?
+   AND chapter = ?
+ ORDER BY verse ASC'''
+VERSE = '''\
+SELECT content
+  FROM bible
+ WHERE book = ?
+   AND chapter = ?
+   AND verse = ?'''
+RANGE = '''\
+SELECT verse,
+       content
+  FROM bible
+ WHERE book = ?
+   AND chapter = ?
+   AND verse BETWEEN ? AND ?
+ ORDER BY verse ASC'''
+SEARCH = f'''\
+SELECT bible.book,
+       bible.chapter,
+       bible.verse,
+       bible.content
+  FROM bible_search
+  JOIN bible
+    ON bible.book = bible_search.rowid / {SEARCH_KEY[0]}
+   AND bible.chapter = bible_search.rowid % {SEARCH_KEY[0]} / {SEARCH_KEY[1]}
+   AND bible.verse = bible_search.rowid % {SEARCH_KEY[1]}
+ WHERE bible_search MATCH ?
+ ORDER BY bible_search.rank
+ LIMIT ?'''
@@ -9,6 +9,7 @@ import datetime
 
 import compare
 import manager
+import tracing
 import async_exc_adapter as timeout
 
 # Public Names
@@ -28,7 +29,16 @@ class Verse:
 
     The Verse class initially came from TestVerse, written in Java and
     ported into Python. The verse-checking implementation was extremely
-    naive and has been reimplemented in another module for this version."""
+    naive and has been reimplemented in another module for this version.
+    Instances use slots, and the handle that runs a check in the background
+    is only created once a check is started, keeping unchecked verses small."""
+
+    __slots__ = (
+        '__addr',
+        '__text',
+        '__search',
+        'show_hint'
+    )
 
     __timeout = None    # Create a default value.
     __manager = False
@@ -53,8 +63,10 @@ class Verse:
         """Initialize the reference and text of a Verse instance."""
         self.__addr = addr
         self.__text = text
-        self.__search = timeout.add_timeout(compare.search)
+        self.__search = None
+        self.show_hint = False
 
+    @tracing.traced('Verse.check')
     def check(self, entry, limit=0, ident=''):
         """Check the entry against the verse's official text.
 
@@ -69,9 +81,16 @@ class Verse:
         self.__search(self.__text, entry)
         if Verse.__manager:
             # The verse manager timeout system should be used.
-            with Verse.__timeout:
-                session = manager.Session(limit + 1, self.__search.cancel)
-                Verse.__timeout[ident + ' -> ' + self.__addr] = session
+            session = manager.Session(limit + 1, self.__search.cancel)
+            Verse.__timeout[ident + ' -> ' + self.__addr] = session
+
+    def restore(self, value):
+        """Accept the value of a check that was already run elsewhere.
+
+        Sessions shared between processes only carry the results of their
+        checks. Restoring a result makes the "ready" and "value" properties
+        act as though the check had finished running on this instance."""
+        self.__search = _Checked(value)
 
     @property
     def addr(self):
@@ -91,9 +110,31 @@ class Verse:
     @property
     def ready(self):
         """Read-only status property for a verse check."""
-        return self.__search.ready
+        if self.__search is not None:
+            return self.__search.ready
 
     @property
     def value(self):
         """Read-only return property for a verse check."""
-        return self.__search.value
+        if self.__search is not None:
+            return self.__search.value
+
+
+class _Checked:
+    """Stand in for a verse check that has already finished running."""
+
+    __slots__ = (
+        'value',
+    )
+
+    def __init__(self, value):
+        """Initialize the instance with the value the check returned."""
+        self.value = value
+
+    def cancel(self):
+        """Ignore the request since there is nothing left to cancel."""
+
+    @property
+    def ready(self):
+        """Read-only property showing that the value is always ready."""
+        return True
@@ -5,18 +5,33 @@
 Pulling Bible verses out of a database allows query details to be
 abstracted away and powerful Verse objects returned to the caller."""
 
+import array
+import asyncio
+import bisect
+import collections
 import datetime
+import heapq
+import itertools
+import mmap
+import pathlib
 import threading
 import queue
+import re
 import sqlite3
+import struct
 import sys
+import time
 
 import async_exc
+import bible_sql
 import bible_verse
+import tracing
 
 # Public Names
 __all__ = (
     'BibleServer',
+    'BibleBuffer',
+    'BibleMap'
 )
 
 # Module Documentation
@@ -25,6 +40,12 @@ __date__ = datetime.date(2020, 6, 30)
 __author__ = 'Stephen Paul Chappell'
 __credits__ = 'Summer Computer Science Camp'
 
+# Symbolic Constants
+_MAP_MAGIC = b'KJV1'
+_MAP_HEADER = struct.Struct('<4sIII')   # magic, books, chapters, verses
+_WORD = re.compile(r'[^\W_]+')
+
+
 
 class BibleServer:
     """Execute a protected SQLite3 database on a singular thread.
@@ -32,7 +53,11 @@ class BibleServer:
     Since a SQLite3 database can only accept queries on the thread that it
     was created on, this server receives requests through a queue and sends
     back the result through a list and mutex mechanism. The verses returned
-    from queries are automatically wrapped in their own Verse objects."""
+    from queries are automatically wrapped in their own Verse objects.
+    Since the Bible is never written to, a pool of read-only connections
+    may also be opened so that queries run on the callers' own threads.
+    Coroutine versions of the fetch methods let asyncio programs await the
+    database thread instead of blocking while they wait for their answers."""
 
     BOOKS = ('Genesis', 'Exodus', 'Leviticus', 'Numbers', 'Deuteronomy',
              'Joshua', 'Judges', 'Ruth', '1 Samuel', '2 Samuel', '1 Kings',
@@ -48,16 +73,41 @@ class BibleServer:
              'Hebrews', 'James', '1 Peter', '2 Peter', '1 John', '2 John',
              '3 John', 'Jude', 'Revelation')
 
-    def __init__(self, *args):
-        """Initialize the BibleServer with a SQLite3 database thread."""
-        self.__ready = threading.Event()
-        self.__thread = async_exc.Thread(target=self.__serve, args=args)
-        self.__thread.start()
-        self.__ready.wait()
-        del self.__ready
-        if self.__error is not None:
-            raise self.__error
-        del self.__error
+    BATCH_SIZE = 400    # Chapters fetched with each query by fetch_many.
+
+    def __init__(self, *args, pool_size=0):
+        """Initialize the BibleServer with a SQLite3 database thread.
+
+        If the pool size is positive, that many read-only connections are
+        opened instead. Queries then check out a connection from the pool
+        rather than waiting in line for the database thread to answer them,
+        and the thread is only started if a coroutine needs it later on."""
+        self.__mutex = threading.Lock()
+        self.__queries, self.__wait_time, self.__execute_time = 0, 0.0, 0.0
+        self.__args, self.__thread, self.__pool = args, None, None
+        if pool_size > 0:
+            uri = pathlib.Path(args[0]).resolve().as_uri() + '?mode=ro'
+            self.__pool = queue.SimpleQueue()
+            for _ in range(pool_size):
+                self.__pool.put(sqlite3.connect(
+                    uri, uri=True, check_same_thread=False))
+        else:
+            self.__start()
+
+    def __start(self):
+        """Start the database thread and wait for it to connect."""
+        with self.__mutex:
+            if self.__thread is None:
+                self.__ready = threading.Event()
+                thread = async_exc.Thread(target=self.__serve,
+                                          args=self.__args, daemon=True)
+                thread.start()
+                self.__ready.wait()
+                del self.__ready
+                if self.__error is not None:
+                    raise self.__error
+                del self.__error
+                self.__thread = thread
 
     def __serve(self, *args):
         """Run a server continuously to answer SQL queries.
@@ -65,7 +115,8 @@ class BibleServer:
         A SQLite3 connection is made in this thread with errors being raised
         again for the instantiating caller. If the connection was made
         successfully, then the server goes into a continuous loop, processing
-        SQL queries."""
+        SQL queries. Each answer ends with when the query started running
+        and how long it took, as measured here in the database thread."""
         database = None
         # noinspection PyBroadException,PyPep8
         try:
@@ -74,71 +125,197 @@ class BibleServer:
             self.__error = error = sys.exc_info()[1]
         else:
             self.__error = error = None
+            self.__queue = queue.Queue()
         self.__ready.set()
         if error is None:
-            self.__queue = queue.Queue()
             while True:
-                ready, one, sql, parameters, ret = self.__queue.get()
-                # noinspection PyBroadException,PyPep8
-                try:
-                    cursor = database.cursor()
-                    cursor.execute(sql, parameters)
-                    data = cursor.fetchone() if one else cursor.fetchall()
-                    ret[:] = True, data
-                except:
-                    ret[:] = False, sys.exc_info()[1]
-                ready.set()
+                notify, one, sql, parameters, ret = self.__queue.get()
+                start = time.perf_counter()
+                ret[:] = self.__execute(database, one, sql, parameters)
+                ret += start, time.perf_counter() - start
+                notify()
+
+    @staticmethod
+    def __execute(database, one, sql, parameters):
+        """Run the query on the database and report if it succeeded."""
+        # noinspection PyBroadException,PyPep8
+        try:
+            cursor = database.cursor()
+            cursor.execute(sql, parameters)
+            data = cursor.fetchone() if one else cursor.fetchall()
+            return True, data
+        except:
+            return False, sys.exc_info()[1]
 
     def fetch_chapter(self, book, chapter):
         """Fetch all verses from chapter and wrap in Verse objects."""
-        rows = self.__fetch(False, '''\
-SELECT verse,
-       content
-  FROM bible
- WHERE book = ?
-   AND chapter = ?
- ORDER BY verse ASC''', book, chapter)
+        rows = self.__fetch(False, bible_sql.CHAPTER, book, chapter)
         return self.__verses(book, chapter, rows)
 
     def fetch_verse(self, book, chapter, verse):
         """Fetch one verse as specified and wrap in a Verse object."""
-        row = self.__fetch(True, '''\
-SELECT content
-  FROM bible
- WHERE book = ?
-   AND chapter = ?
-   AND verse = ?''', book, chapter, verse)
-        if row is not None:
-            reference = self.__addr(book, chapter, verse)
-            return [bible_verse.Verse(reference, row[0])]
+        row = self.__fetch(True, bible_sql.VERSE, book, chapter, verse)
+        return self.__verse(book, chapter, verse, row)
 
     def fetch_range(self, book, chapter, verse_a, verse_b):
         """Fetch all verses in the range and wrap in Verse objects."""
-        rows = self.__fetch(False, '''\
-SELECT verse,
-       content
-  FROM bible
- WHERE book = ?
-   AND chapter = ?
-   AND verse BETWEEN ? AND ?
- ORDER BY verse ASC''', book, chapter, verse_a, verse_b)
+        rows = self.__fetch(False, bible_sql.RANGE,
+                            book, chapter, verse_a, verse_b)
         return self.__verses(book, chapter, rows)
 
+    async def fetch_chapter_async(self, book, chapter):
+        """Fetch the verses of a chapter without blocking the event loop."""
+        rows = await self.__fetch_async(False, bible_sql.CHAPTER,
+                                        book, chapter)
+        return self.__verses(book, chapter, rows)
+
+    async def fetch_verse_async(self, book, chapter, verse):
+        """Fetch a single verse without blocking the event loop."""
+        row = await self.__fetch_async(True, bible_sql.VERSE,
+                                       book, chapter, verse)
+        return self.__verse(book, chapter, verse, row)
+
+    async def fetch_range_async(self, book, chapter, verse_a, verse_b):
+        """Fetch a range of verses without blocking the event loop."""
+        rows = await self.__fetch_async(False, bible_sql.RANGE,
+                                        book, chapter, verse_a, verse_b)
+        return self.__verses(book, chapter, rows)
+
+    def fetch_many(self, references):
+        """Fetch the verses for many references with only a few queries.
+
+        Each reference is a (book, chapter, verse_a, verse_b) tuple like those
+        parsed out of verse files. A whole chapter has verse_a set to None,
+        and a reference that could not be parsed has book set to None. All
+        the chapters referred to are read with one query per BATCH_SIZE of
+        them, and a list is returned with what each reference would fetch."""
+        chapters = {}
+        keys = list(dict.fromkeys((book, chapter) for book, chapter, *_ in
+                                  references if book is not None))
+        for offset in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[offset:offset + self.BATCH_SIZE]
+            for book, chapter, verse, content in self.__fetch(False, f'''\
+SELECT bible.book,
+       bible.chapter,
+       bible.verse,
+       bible.content
+  FROM (VALUES {', '.join(['(?, ?)'] * len(batch))}) AS wanted
+  JOIN bible
+    ON bible.book = wanted.column1
+   AND bible.chapter = wanted.column2
+ ORDER BY bible.book ASC,
+          bible.chapter ASC,
+          bible.verse ASC''', *itertools.chain.from_iterable(batch)):
+                chapters.setdefault((book, chapter), []).append(
+                    (verse, content))
+        found = []
+        for book, chapter, verse_a, verse_b in references:
+            rows = chapters.get((book, chapter), ())
+            if verse_a is not None:
+                rows = [row for row in rows if verse_a <= row[0] <= verse_b]
+            found.append(self.__verses(book, chapter, rows))
+        return found
+
+    def search(self, phrase, limit=10):
+        """Find verses that contain the phrase and wrap in Verse objects.
+
+        The full-text index made by database/build.py is searched for the
+        words of the phrase in order, ignoring case and punctuation. Up to
+        limit verses are returned in a list with the best matches first."""
+        words = _WORD.findall(phrase)
+        if not words:
+            return []
+        rows = self.__fetch(False, bible_sql.SEARCH,
+                            '"' + ' '.join(words) + '"', limit)
+        return [bible_verse.Verse(self.__addr(book, chapter, verse), content)
+                for book, chapter, verse, content in rows]
+
+    @tracing.traced('BibleServer.fetch')
     def __fetch(self, one, sql, *parameters):
         """Execute the specified SQL query and return the results.
 
         This is a powerful shortcut method that is the closest connection
         other threads will have with the SQL server. The parameters for the
         query are dumped into a queue, and the answer is retrieved when it
-        becomes available. This prevents SQLite3 from throwing exceptions."""
-        ready, ret = threading.Event(), []
-        self.__queue.put((ready, one, sql, parameters, ret))
-        ready.wait()
-        valid, value = ret
+        becomes available. This prevents SQLite3 from throwing exceptions.
+        When there is a pool, a connection is taken from it instead and the
+        query is run right here. The time spent waiting is kept separately
+        from the time spent executing the query for the stats property,
+        and the execution is traced as a span of its own within the fetch."""
+        start = time.perf_counter()
+        if self.__pool is None:
+            ready, ret = threading.Event(), []
+            self.__queue.put((ready.set, one, sql, parameters, ret))
+            ready.wait()
+            valid, value, began, execute_time = ret
+        else:
+            database = self.__pool.get()
+            began = time.perf_counter()
+            try:
+                valid, value = self.__execute(database, one, sql, parameters)
+            finally:
+                self.__pool.put(database)
+            execute_time = time.perf_counter() - began
+        tracing.record('BibleServer.execute', began, execute_time)
+        return self.__result(start, valid, value, execute_time)
+
+    async def __fetch_async(self, one, sql, *parameters):
+        """Execute the specified SQL query while the event loop keeps going.
+
+        The query is always sent to the database thread, even when there is
+        a pool, so that no thread is tied up waiting on it. When the query
+        is done, the database thread has the loop wake up the caller again.
+        With a pool, the thread is started by the first of these queries."""
+        if self.__thread is None:
+            self.__start()
+        loop = asyncio.get_running_loop()
+        future, ret = loop.create_future(), []
+        start = time.perf_counter()
+        self.__queue.put((self.__notifier(loop, future),
+                          one, sql, parameters, ret))
+        await future
+        valid, value, _, execute_time = ret
+        return self.__result(start, valid, value, execute_time)
+
+    @staticmethod
+    def __notifier(loop, future):
+        """Create a function that the database thread uses to wake a future."""
+
+        def wake():
+            if not future.done():
+                future.set_result(None)
+
+        def notify():
+            try:
+                loop.call_soon_threadsafe(wake)
+            except RuntimeError:
+                pass    # The loop was closed while the query was running.
+
+        return notify
+
+    def __result(self, start, valid, value, execute_time):
+        """Add a finished query to the stats and return or raise its value."""
+        wait_time = time.perf_counter() - start - execute_time
+        with self.__mutex:
+            self.__queries += 1
+            self.__wait_time += wait_time
+            self.__execute_time += execute_time
         if valid:
             return value
         raise value
 
+    @property
+    def stats(self):
+        """Read-only totals of queries run and the time spent on them.
+
+        Wait time covers getting a query to a connection, either through
+        the queue to the database thread or by checking one out of the pool.
+        Execute time is the time that SQLite3 spent answering the queries."""
+        with self.__mutex:
+            return dict(queries=self.__queries,
+                        wait_time=self.__wait_time,
+                        execute_time=self.__execute_time)
+
     def __verses(self, book, chapter, rows):
         """Wrap the text from the rows in Verse objects.
 
@@ -148,11 +325,226 @@ SELECT verse,
             return [bible_verse.Verse(self.__addr(book, chapter, verse), text)
                     for verse, text in rows]
 
+    def __verse(self, book, chapter, verse, row):
+        """Wrap the text from the row in a Verse object if it was found."""
+        if row is not None:
+            reference = self.__addr(book, chapter, verse)
+            return [bible_verse.Verse(reference, row[0])]
+
     def __addr(self, book, chapter, verse):
         """Construct a verse reference from the final three parameters."""
         return f'{self.BOOKS[book - 1]} {chapter}:{verse}'
 
     def __del__(self):
         """Terminates the internal thread when the database is deleted."""
-        if self.__thread.is_alive():
+        if self.__thread is not None and self.__thread.is_alive():
             self.__thread.exit()
+
+
+class BibleBuffer:
+    """Serve verses from a single buffer holding the whole Bible in memory.
+
+    The text of every verse is stored back to back as UTF-8 in one buffer.
+    Three arrays index it: the offset where each verse starts, the first
+    verse of each chapter, and the first chapter of each book. Fetching is
+    done by slicing the buffer, so no SQL or threads are involved at all.
+    The methods return the same values that a BibleServer would return."""
+
+    BOOKS = BibleServer.BOOKS
+
+    def __init__(self, path):
+        """Initialize the buffer and its indexes from the database on path.
+
+        The index used for searching is built here as well, so that the
+        first search does not have to wait on it while answering a request."""
+        text, verses, chapters, books = self._read(path)
+        self.__text = memoryview(text)
+        self.__verses = verses
+        self.__chapters = chapters
+        self.__books = books
+        self.__index = self.__search_index()
+
+    @staticmethod
+    def _read(path):
+        """Load every verse from a SQLite3 database into a buffer.
+
+        The buffer is returned with the three indexes that describe it. Each
+        index ends with an extra entry so that item i + 1 marks where item i
+        stops. Chapters and verses are expected to be numbered from one up."""
+        text, verses = bytearray(), array.array('I', [0])
+        chapters, books = array.array('I'), array.array('I')
+        database = sqlite3.connect(path)
+        try:
+            last = None
+            for book, chapter, content in database.execute('''\
+SELECT book,
+       chapter,
+       content
+  FROM bible
+ ORDER BY book ASC,
+          chapter ASC,
+          verse ASC'''):
+                if (book, chapter) != last:
+                    if last is None or book != last[0]:
+                        books.append(len(chapters))
+                    chapters.append(len(verses) - 1)
+                    last = book, chapter
+                text += content.encode()
+                verses.append(len(text))
+        finally:
+            database.close()
+        chapters.append(len(verses) - 1)
+        books.append(len(chapters) - 1)
+        return bytes(text), verses, chapters, books
+
+    @tracing.traced('BibleBuffer.fetch_chapter')
+    def fetch_chapter(self, book, chapter):
+        """Fetch all verses from chapter and wrap in Verse objects."""
+        first, end = self.__chapter(book, chapter)
+        return self.__wrap(book, chapter, first, first, end)
+
+    @tracing.traced('BibleBuffer.fetch_verse')
+    def fetch_verse(self, book, chapter, verse):
+        """Fetch one verse as specified and wrap in a Verse object."""
+        first, end = self.__chapter(book, chapter)
+        index = first + verse - 1
+        if first <= index < end:
+            return self.__wrap(book, chapter, first, index, index + 1)
+
+    @tracing.traced('BibleBuffer.fetch_range')
+    def fetch_range(self, book, chapter, verse_a, verse_b):
+        """Fetch all verses in the range and wrap in Verse objects."""
+        first, end = self.__chapter(book, chapter)
+        start = max(first, first + verse_a - 1)
+        stop = min(end, first + verse_b)
+        return self.__wrap(book, chapter, first, start, stop)
+
+    async def fetch_chapter_async(self, book, chapter):
+        """Fetch the verses of a chapter, finishing as soon as awaited."""
+        return self.fetch_chapter(book, chapter)
+
+    async def fetch_verse_async(self, book, chapter, verse):
+        """Fetch a single verse, finishing as soon as it is awaited."""
+        return self.fetch_verse(book, chapter, verse)
+
+    async def fetch_range_async(self, book, chapter, verse_a, verse_b):
+        """Fetch a range of verses, finishing as soon as it is awaited."""
+        return self.fetch_range(book, chapter, verse_a, verse_b)
+
+    @tracing.traced('BibleBuffer.fetch_many')
+    def fetch_many(self, references):
+        """Fetch the verses for many references in a single call.
+
+        References are given as they would be to BibleServer.fetch_many, and
+        the same list is returned. Nothing needs to be batched since every
+        lookup is already done right in memory."""
+        return [self.__reference(*reference) for reference in references]
+
+    @tracing.traced('BibleBuffer.search')
+    def search(self, phrase, limit=10):
+        """Find verses that contain the phrase and wrap in Verse objects.
+
+        The words of the phrase are turned into their IDs and looked for in
+        the index that was built when this instance was created. Verses are
+        ranked by how often the phrase shows up in them for their length,
+        and up to limit verses are returned in a list with the best first."""
+        words = _WORD.findall(phrase.casefold())
+        if not words:
+            return []
+        ids, tokens, starts = self.__index
+        if any(word not in ids for word in words):
+            return []
+        needle = ''.join(chr(ids[word]) for word in words)
+        hits = collections.Counter()
+        position = tokens.find(needle)
+        while position >= 0:
+            hits[bisect.bisect_right(starts, position) - 1] += 1
+            position = tokens.find(needle, position + 1)
+        return [self.__verse(index) for _, index in heapq.nsmallest(limit, (
+            (-count / (starts[index + 1] - starts[index]), index)
+            for index, count in hits.items()
+        ))]
+
+    def __search_index(self):
+        """Build the index of interned words that searching makes use of.
+
+        Every word is interned as an ID, and the words of each verse become
+        a string of characters with their IDs as code points. The strings of
+        all the verses are joined, each ending with a zero so that a phrase
+        cannot run from one verse into the next, and the position where each
+        verse starts is kept in an array."""
+        ids, strings, starts = {}, [], array.array('I', [0])
+        for index in range(len(self.__verses) - 1):
+            strings.append(''.join(
+                chr(ids.setdefault(word, len(ids) + 1)) for word in
+                _WORD.findall(self.__decode(index).casefold())
+            ) + '\0')
+            starts.append(starts[-1] + len(strings[-1]))
+        return ids, ''.join(strings), starts
+
+    def __verse(self, index):
+        """Wrap the verse at the index in a Verse object."""
+        chapter = bisect.bisect_right(self.__chapters, index) - 1
+        book = bisect.bisect_right(self.__books, chapter) - 1
+        first = self.__chapters[chapter]
+        return self.__wrap(book + 1, chapter - self.__books[book] + 1,
+                           first, index, index + 1)[0]
+
+    def __decode(self, index):
+        """Get the text of the verse at the index out of the buffer."""
+        return str(self.__text[self.__verses[index]:
+                               self.__verses[index + 1]], 'utf-8')
+
+    def __reference(self, book, chapter, verse_a, verse_b):
+        """Fetch the verses for one of the references given to fetch_many."""
+        if book is not None:
+            if verse_a is None:
+                return self.fetch_chapter(book, chapter)
+            return self.fetch_range(book, chapter, verse_a, verse_b)
+
+    def __chapter(self, book, chapter):
+        """Find the indexes of the first and last (exclusive) verses."""
+        if 0 < book < len(self.__books) and chapter > 0:
+            index = self.__books[book - 1] + chapter - 1
+            if index < self.__books[book]:
+                return self.__chapters[index], self.__chapters[index + 1]
+        return 0, 0
+
+    def __wrap(self, book, chapter, first, start, stop):
+        """Wrap the verses from start to stop in Verse objects if any."""
+        if start < stop:
+            name = self.BOOKS[book - 1]
+            return [bible_verse.Verse(
+                f'{name} {chapter}:{index - first + 1}', self.__decode(index)
+            ) for index in range(start, stop)]
+
+
+class BibleMap(BibleBuffer):
+    """Serve verses from a flat file that is mapped into memory.
+
+    The file is created by database/build.py and holds the same buffer and
+    indexes that a BibleBuffer builds. Nothing is parsed or copied when the
+    file is opened, and every server process mapping the file shares the
+    same pages of memory with all of the others through the page cache."""
+
+    @staticmethod
+    def _read(path):
+        """Map the file on path and get views of its buffer and indexes."""
+        with open(path, 'rb') as file:
+            view = memoryview(
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, *sizes = _MAP_HEADER.unpack_from(view)
+        if magic != _MAP_MAGIC:
+            raise ValueError(f'{path} does not start with {_MAP_MAGIC!r}')
+        offset, indexes = _MAP_HEADER.size, []
+        for size in sizes:
+            index = view[offset:offset + 4 * (size + 1)]
+            if sys.byteorder == 'little':
+                index = index.cast('I')
+            else:
+                index = array.array('I', index)
+                index.byteswap()
+            indexes.append(index)
+            offset += 4 * (size + 1)
+        books, chapters, verses = indexes
+        return view[offset:], verses, chapters, books
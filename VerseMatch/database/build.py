@@ -3,95 +3,276 @@
 """Generate a database file that contains the entire Bible in it.
 
 This is a standalone program used to create the pg30.db database file that has
-the entire Bible. The database is used by the Bible Verse Quiz program."""
+the entire Bible. The database is used by the Bible Verse Quiz program. A
+full-text index of the verses is included so that phrases can be looked up.
 
+The pg30.bin file is also created, holding the same verses in a flat format
+that can be mapped into memory. A header gives the number of books, chapters,
+and verses. Three arrays of little-endian unsigned 32-bit integers follow: the
+first chapter of each book, the first verse of each chapter, and the offset of
+each verse in the text. Each array has an extra entry at the end so that entry
+i + 1 marks where item i stops. The UTF-8 text of all the verses comes last."""
+
+import array
 import datetime
 import mmap
 import pathlib
+import re
 import sqlite3
+import struct
+import sys
+import time
+
+# The SQL is shared with the Bible server in the directory above this one.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import bible_sql
 
 # Public Names
 __all__ = (
     'main',
-    'parse_bible'
+    'parse_bible',
+    'read_database',
+    'write_database',
+    'explain_queries',
+    'write_map',
+    'verify_map'
 )
 
 # Module Documentation
-__version__ = 1, 0, 1
+__version__ = 1, 3, 0
 __date__ = datetime.date(2020, 6, 30)
 __author__ = 'Stephen Paul Chappell'
 __credits__ = 'Summer Computer Science Camp'
 
+# Symbolic Constants
+MAP_MAGIC = b'KJV1'
+MAP_HEADER = struct.Struct('<4sIII')    # magic, books, chapters, verses
+VERSE_PATTERN = re.compile(rb'''(?xs)
+    (\d\d):(\d\d\d):(\d\d\d)\x20    # book, chapter, and verse numbers
+    (.*?)                           # text of the verse
+    (?=\r\n\r\n|\n\n|\r\r|\Z)       # blank line or end of file''')
+QUERIES = {     # The queries run by BibleServer and parameters to plan with.
+    'fetch_chapter': (bible_sql.CHAPTER, (1, 1)),
+    'fetch_verse': (bible_sql.VERSE, (1, 1, 1)),
+    'fetch_range': (bible_sql.RANGE, (1, 1, 1, 2)),
+    'search': (bible_sql.SEARCH, ('"in the beginning"', 10))
+}
+
 
 def main():
     """Read the pg30.txt Bible file and create the pg30.db database file."""
-    bible = parse_bible(pathlib.Path('pg30.txt'))
-    # Create the database being built.
-    connection = sqlite3.connect('pg30.db')
-    cursor = connection.cursor()
-    cursor.execute('''\
+    start = time.perf_counter()
+    count = write_database(parse_bible(pathlib.Path('pg30.txt')),
+                           pathlib.Path('pg30.db'))
+    built = time.perf_counter()
+    print(f'Parsed and inserted {count:,} verses into pg30.db in '
+          f'{built - start:.3f} seconds')
+    for line in explain_queries(pathlib.Path('pg30.db')):
+        print(line)
+    # Create the flat file and make sure it agrees with the database.
+    write_map(read_database(pathlib.Path('pg30.db')), pathlib.Path('pg30.bin'))
+    verify_map(pathlib.Path('pg30.db'), pathlib.Path('pg30.bin'))
+
+
+def parse_bible(path):
+    """Scan a specially formatted file and generate the verses found in it.
+
+    The file is mapped into memory and searched once from start to end. A
+    tuple of the book, chapter, verse, and text is generated for each verse,
+    so only one verse needs to be held in memory at a time. Each verse must
+    be the next one in its chapter or the first in the next chapter or book;
+    a verse that is out of order is reported on stderr and skipped."""
+    last = 1, 1, 0
+    with path.open('rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as bible:
+            for match in VERSE_PATTERN.finditer(bible):
+                book, chapter, verse, text = match.groups()
+                address = int(book), int(chapter), int(verse)
+                if address not in _following(*last):
+                    print('Skipping {}:{}:{} since it cannot follow {}:{}:{}'
+                          .format(*address, *last), file=sys.stderr)
+                    continue
+                yield (*address, ' '.join(text.decode().split()))
+                last = address
+    if last[2] == 0:
+        raise EOFError('could not find any of the expected data')
+
+
+def _following(book, chapter, verse):
+    """Get the addresses that are allowed to come after the one given."""
+    return (book, chapter, verse + 1), (book, chapter + 1, 1), (book + 1, 1, 1)
+
+
+def write_database(rows, path):
+    """Write the verses generated by parse_bible to a new database file.
+
+    Any old file is replaced. Journaling and syncing are turned off while the
+    build runs since a failed build can simply be started over, and all of
+    the verses are inserted in one transaction. A full-text index is also
+    filled in with the verses, using bible_sql.SEARCH_KEY to number its rows
+    by book, chapter, and verse. The number of verses written is returned."""
+    if path.exists():
+        path.unlink()
+    connection = sqlite3.connect(str(path), isolation_level=None)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('PRAGMA locking_mode = EXCLUSIVE')
+        connection.execute('''\
 CREATE TABLE bible (
-  book    INTEGER,
-  chapter INTEGER,
-  verse   INTEGER,
-  content TEXT
-)''')
-    # Add all verses to database.
-    for book_i, book in enumerate(bible, 1):
-        for chapter_i, chapter in enumerate(book, 1):
-            for verse_i, verse in enumerate(chapter, 1):
-                cursor.execute('''\
+  book    INTEGER NOT NULL,
+  chapter INTEGER NOT NULL,
+  verse   INTEGER NOT NULL,
+  content TEXT NOT NULL,
+  PRIMARY KEY (book, chapter, verse)
+) WITHOUT ROWID''')
+        connection.execute('BEGIN')
+        cursor = connection.executemany('''\
 INSERT INTO bible (
   book,
   chapter,
   verse,
   content
-) VALUES (?, ?, ?, ?)''',
-                               (book_i, chapter_i, verse_i, verse))
-    # Commit changes and close database.
-    connection.commit()
-    connection.close()
+) VALUES (?, ?, ?, ?)''', rows)
+        count = cursor.rowcount
+        connection.execute('''\
+CREATE VIRTUAL TABLE bible_search USING fts5 (
+  content,
+  content = ''
+)''')
+        connection.execute('''\
+INSERT INTO bible_search (
+  rowid,
+  content
+)
+SELECT book * ? + chapter * ? + verse,
+       content
+  FROM bible''', bible_sql.SEARCH_KEY)
+        connection.execute(
+            "INSERT INTO bible_search (bible_search) VALUES ('optimize')")
+        connection.execute('COMMIT')
+        connection.execute('ANALYZE')
+    finally:
+        connection.close()
+    return count
 
 
-def parse_bible(path):
-    """Take a specially formatted file and extract the Bible's structure."""
-    book = chapter = verse = 1
-    book_list, chapter_list, verse_list = [], [], []
-    start = 0
-    with path.open('rb') as file:
-        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as bible:
-            for next_line in b'\r\n', b'\r', b'\n':
-                if bible.find(next_line) >= 0:
-                    break
-            else:
-                raise EOFError('could not find any line delimiters')
-            while True:
-                sub = f'{book:02}:{chapter:03}:{verse:03} '.encode()
-                index = bible.find(sub, start)
-                if index >= 0:
-                    start = index + len(sub)
-                    end = bible.find(next_line * 2, start)
-                    if end < 0:
-                        raise EOFError('could not find the end of the verse')
-                    bible.seek(start)
-                    verse_text = bible.read(end - start).decode()
-                    verse_list.append(' '.join(verse_text.split()))
-                    start = end
-                    verse += 1
-                elif verse != 1:
-                    chapter_list.append(tuple(verse_list))
-                    verse_list.clear()
-                    chapter += 1
-                    verse = 1
-                elif chapter != 1:
-                    book_list.append(tuple(chapter_list))
-                    chapter_list.clear()
-                    book += 1
-                    chapter = 1
-                elif book != 1:
-                    return tuple(book_list)
-                else:
-                    raise EOFError('could not find any of the expected data')
+def explain_queries(path):
+    """Generate lines describing how the server's queries will be run.
+
+    Each query that BibleServer uses is shown with the plan SQLite chose for
+    it, so a query that has to scan the whole table is easy to spot."""
+    connection = sqlite3.connect(str(path))
+    try:
+        for name, (sql, parameters) in QUERIES.items():
+            yield f'Query plan for {name}:'
+            for row in connection.execute('EXPLAIN QUERY PLAN ' + sql,
+                                          parameters):
+                yield f'  {row[-1]}'
+    finally:
+        connection.close()
+
+
+def read_database(path):
+    """Generate the verses in a database file in the order they are found."""
+    connection = sqlite3.connect(str(path))
+    try:
+        yield from connection.execute('''\
+SELECT book,
+       chapter,
+       verse,
+       content
+  FROM bible
+ ORDER BY book ASC,
+          chapter ASC,
+          verse ASC''')
+    finally:
+        connection.close()
+
+
+def write_map(rows, path):
+    """Write verses like those generated by parse_bible to a flat file.
+
+    The rows must be in order and must start with the first verse of the
+    first chapter of the first book, as the file is indexed by position."""
+    text, verses = bytearray(), array.array('I', [0])
+    chapters, books = array.array('I'), array.array('I')
+    for book, chapter, verse, content in rows:
+        if verse == 1:
+            if chapter == 1:
+                books.append(len(chapters))
+            chapters.append(len(verses) - 1)
+        text += content.encode()
+        verses.append(len(text))
+    chapters.append(len(verses) - 1)
+    books.append(len(chapters) - 1)
+    with path.open('wb') as file:
+        file.write(MAP_HEADER.pack(MAP_MAGIC, len(books) - 1,
+                                   len(chapters) - 1, len(verses) - 1))
+        for index in books, chapters, verses:
+            if sys.byteorder != 'little':
+                index.byteswap()
+            file.write(index.tobytes())
+        file.write(text)
+
+
+def verify_map(database_path, map_path):
+    """Check that the flat file holds exactly the verses in the database.
+
+    Every row of the bible table is looked up in the flat file, and the
+    file must not contain any other verses. A ValueError is raised at the
+    first difference or at an index that points outside of the file.
+    Otherwise, the number of verses checked is returned."""
+    buffer = map_path.read_bytes()
+    magic, *sizes = MAP_HEADER.unpack_from(buffer)
+    if magic != MAP_MAGIC:
+        raise ValueError(f'{map_path} does not start with {MAP_MAGIC!r}')
+    offset, indexes = MAP_HEADER.size, []
+    for size in sizes:
+        stop = offset + 4 * (size + 1)
+        if stop > len(buffer):
+            raise ValueError(f'{map_path} is too short for its header')
+        index = array.array('I', buffer[offset:stop])
+        if sys.byteorder != 'little':
+            index.byteswap()
+        indexes.append(index)
+        offset = stop
+    books, chapters, verses = indexes
+    text = buffer[offset:]
+    count = 0
+    for book, chapter, verse, content in read_database(database_path):
+        index = _position(books, book - 1, chapter, len(chapters) - 1)
+        if index is not None:
+            index = _position(chapters, index, verse, len(verses) - 1)
+        if index is not None and not \
+                verses[index] <= verses[index + 1] <= len(text):
+            index = None
+        if index is None:
+            raise ValueError(f'{book}:{chapter}:{verse} is missing from '
+                             f'{map_path} or is out of its bounds')
+        found = text[verses[index]:verses[index + 1]].decode()
+        if found != content:
+            raise ValueError(f'{book}:{chapter}:{verse} is {found!r} in '
+                             f'{map_path} instead of {content!r}')
+        count += 1
+    if count != len(verses) - 1:
+        raise ValueError(f'{map_path} has {len(verses) - 1} verses, '
+                         f'but {database_path} has {count}')
+    return count
+
+
+def _position(index, item, number, limit):
+    """Find the numbered entry of an item in an index of a flat file.
+
+    Entries are numbered from one, and the item's entries end where the
+    next item's start. None is returned if the item or number is out of
+    range or if the entries found go past the limit given."""
+    if not 0 <= item < len(index) - 1:
+        return None
+    start, stop = index[item], index[item + 1]
+    if not 0 < number <= stop - start or stop > limit:
+        return None
+    return start + number - 1
 
 
 if __name__ == '__main__':
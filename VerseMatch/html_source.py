@@ -3,40 +3,146 @@
 """Define several XHTML document strings to be used in VerseMatch.
 
 Unlike the original program written in Java, a large portion of the
-XHTML code is defined separately here to be used as format strings."""
+XHTML code is defined separately here to be used as format strings.
+The templates are loaded once and compiled so that rendering them does
+not need to touch the file system or parse the format strings again."""
 
 import datetime
-import math
 import pathlib
-import sys
+import string
+import threading
+import time
 
 # Public Names
 __all__ = (
+    'Template',
+    'reload',
+    'generation',
+    'watch'
 )
 
 # Module Documentation
-__version__ = 1, 0, 5
+__version__ = 1, 1, 0
 __date__ = datetime.date(2020, 6, 30)
 __author__ = 'Stephen Paul Chappell'
 __credits__ = 'Summer Computer Science Camp'
 
+# Symbolic Constants
+_CONVERSIONS = {None: lambda value: value, 's': str, 'r': repr, 'a': ascii}
+
+
+class Template(str):
+    """Keep the text of a template together with a compiled renderer.
+
+    Since a Template is a string, it can be used anywhere its text could.
+    The render method takes the same positional arguments as the format
+    method, but the fields were found in the text when it was compiled.
+    Templates with fields that cannot be compiled are rendered by format."""
+
+    def __new__(cls, text):
+        """Create the template and compile its fields into a function."""
+        self = super().__new__(cls, text)
+        self.render = self.__compile(text)
+        return self
+
+    @staticmethod
+    def __compile(text):
+        """Turn the format string into a function that fills in its fields.
+
+        The text is split into literals and fields once, and each field is
+        kept as the index of its argument with the conversion and the spec
+        to format it with. Rendering only has to join the pieces together."""
+        pieces, automatic = [], 0
+        try:
+            for literal, field, spec, conversion in \
+                    string.Formatter().parse(text):
+                if field is not None:
+                    if field == '':
+                        field, automatic = str(automatic), automatic + 1
+                    if not field.isdigit() or '{' in spec:
+                        return text.format
+                    field = int(field), _CONVERSIONS[conversion], spec
+                pieces.append((literal, field))
+        except (KeyError, ValueError):
+            return text.format
+        pieces = tuple(pieces)
+
+        def render(*args):
+            parts = []
+            for literal, field in pieces:
+                parts.append(literal)
+                if field is not None:
+                    index, convert, spec = field
+                    parts.append(format(convert(args[index]), spec))
+            return ''.join(parts)
+
+        return render
+
 
 def __getattr__(name):
-    """Get HTML templates from ROOT while caching the file contents."""
+    """Get HTML templates from ROOT that were loaded and compiled already."""
     if name.isupper():  # Is the name for a constant value?
-        path = (__getattr__.ROOT / name.casefold()).with_suffix('.html')
-        if path.is_file():
-            modified = path.stat().st_mtime
-            cache_time, text = __getattr__.CACHE.get(name, (-math.inf, None))
-            if cache_time < modified:
-                with path.open() as file:
-                    text = file.read()
-                __getattr__.CACHE[name] = modified, text
-            return text
-        else:
-            __getattr__.CACHE.pop(name, None)
+        templates = __getattr__.TEMPLATES
+        if templates is None:
+            templates = reload()
+        if name in templates:
+            return templates[name]
     raise AttributeError(name)
 
 
-__getattr__.CACHE = {}
-__getattr__.ROOT = pathlib.Path(sys.argv[0]).parent / 'templates'
+__getattr__.TEMPLATES = None
+__getattr__.STAMP = None
+__getattr__.GENERATION = 0
+__getattr__.ROOT = pathlib.Path(__file__).parent / 'templates'
+
+
+def reload():
+    """Load and compile every template in ROOT, replacing the old ones.
+
+    Each template is named after its file, so check.html becomes CHECK.
+    The templates are swapped in all at once, and they are also returned.
+    The generation goes up so that anything rendered earlier can be redone."""
+    stamp = _stamp()
+    templates = {}
+    for path in sorted(__getattr__.ROOT.glob('*.html')):
+        if path.is_file():
+            with path.open() as file:
+                templates[path.stem.upper()] = Template(file.read())
+    __getattr__.TEMPLATES, __getattr__.STAMP = templates, stamp
+    __getattr__.GENERATION += 1
+    return templates
+
+
+def generation():
+    """Get the number of times that the templates have been loaded."""
+    return __getattr__.GENERATION
+
+
+def watch(interval):
+    """Start a thread that reloads the templates when their files change.
+
+    The files are only looked at once every interval, so requests never have
+    to wait on the file system. The daemon thread is returned once started."""
+    thread = threading.Thread(target=_watch, args=(interval,), daemon=True)
+    thread.start()
+    return thread
+
+
+def _watch(interval):
+    """Compare the files with the loaded templates after every interval."""
+    while True:
+        time.sleep(interval)
+        try:
+            if _stamp() != __getattr__.STAMP:
+                reload()
+        except OSError:
+            pass    # A file changed while being read, so try again later.
+
+
+def _stamp():
+    """Get the names, sizes, and modification times of the template files."""
+    return tuple(sorted(
+        (path.name, status.st_size, status.st_mtime_ns)
+        for path in __getattr__.ROOT.glob('*.html')
+        for status in (path.stat(),)
+    ))
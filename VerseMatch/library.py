@@ -8,6 +8,7 @@ parsed and prepared for use in a categorized reference database."""
 import datetime
 import operator
 
+import bible_verse
 import database
 
 # Public Names
@@ -16,7 +17,7 @@ __all__ = (
 )
 
 # Module Documentation
-__version__ = 1, 0, 6
+__version__ = 1, 1, 0
 __date__ = datetime.date(2020, 6, 30)
 __author__ = 'Stephen Paul Chappell'
 __credits__ = 'Summer Computer Science Camp'
@@ -27,17 +28,44 @@ class VerseLibrary:
 
     Given a directory that has been specially formatted, this class will
     index its files along with one layer of subdirectories. An XHTML index
-    suitable for a form is automatically generated from the collected data."""
+    suitable for a form is automatically generated from the collected data.
+    When a Bible server is given, the verses of every reference are fetched
+    up front and kept so that quizzes never have to wait on the server."""
 
     TITLE = operator.attrgetter('title')
 
-    def __init__(self, path):
+    def __init__(self, path, bible=None):
         """Initialize variables from data on path."""
         self.__option = _VerseGroup(path)
         self.__groups = [_VerseGroup(content, content.name)
                          for content in path.iterdir() if content.is_dir()]
         self.__groups.sort(key=self.TITLE)
         self.__cache = self.__cache()
+        self.__pinned = {} if bible is None else self.__prefetch(bible)
+
+    def __prefetch(self, bible):
+        """Fetch the verses of every reference in the library at once.
+
+        Only the address and text of each verse are pinned in memory since
+        Verse objects keep the answers of whoever is being quizzed on them.
+        A reference is pinned to None when its verses could not be found."""
+        references = list(dict.fromkeys(
+            reference for group in (self.__option, *self.__groups)
+            for file in group for reference in file.references
+        ))
+        return {reference: None if verses is None else
+                tuple((verse.addr, verse.text) for verse in verses)
+                for reference, verses in
+                zip(references, bible.fetch_many(references))}
+
+    def verses(self, reference):
+        """Create new Verse objects for a reference pinned at startup.
+
+        None is returned for references whose verses could not be found,
+        and a KeyError is raised if the reference was never prefetched."""
+        pinned = self.__pinned[reference]
+        if pinned is not None:
+            return [bible_verse.Verse(addr, text) for addr, text in pinned]
 
     def __cache(self):
         """Generate an XHTML menu from collected information.
@@ -155,6 +183,7 @@ class _VerseFile:
         """Initialize using non-empty lines from file on path."""
         self.__title = path.stem
         self.__lines = list(filter(None, map(str.strip, path.open())))
+        self.__generation = 0
 
     def __getitem__(self, key):
         """Index into file's lines and get a parsed reference back."""
@@ -187,6 +216,7 @@ class _VerseFile:
         if key not in self:
             raise KeyError(f'{type(self).__name__}[{key!r}]')
         del self.__lines[int(key)]
+        self.__generation += 1
 
     def __iter__(self):
         """Create an iterator over the references in the verse file."""
@@ -205,3 +235,13 @@ class _VerseFile:
     def title(self):
         """Read-only title property identifying this file's contents."""
         return self.__title
+
+    @property
+    def generation(self):
+        """Read-only count of the lines that have been deleted so far."""
+        return self.__generation
+
+    @property
+    def references(self):
+        """Read-only property with the parsed references of every line."""
+        return tuple(map(self.__parse, self.__lines))
@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 """Oversee the timely destruction of unused sessions.
 
-The two classes in this module allow automated memory cleanup to be regularly
+The classes in this module allow automated memory cleanup to be regularly
 performed and timed actions to be executed within reasonable time periods."""
 
+import collections
 import datetime
 import threading
 import time
@@ -14,6 +15,7 @@ import async_exc
 # Public Names
 __all__ = (
     'SessionManager',
+    'SharedSessionManager',
     'Session'
 )
 
@@ -24,18 +26,28 @@ __author__ = 'Stephen Paul Chappell'
 __credits__ = 'Summer Computer Science Camp'
 
 
-# noinspection PyProtectedMember
-class SessionManager(async_exc.Thread, threading._RLock, dict):
+class SessionManager(async_exc.Thread):
     """Manage session objects along with associated data.
 
-    This class acts as dictionary with a data-protection mutex.
-    It can run a cleanup routine at regular intervals if needed."""
+    This class acts as a dictionary that is split into several shards, each
+    protected by its own mutex, so that threads looking up different keys
+    rarely wait on each other. Shards keep their sessions ordered by last
+    access. Expired sessions are dropped as soon as they are looked up, and
+    a cleanup routine can regularly trim the oldest ones from each shard.
+    Sessions in one manager should share a similar time to live so that
+    the oldest sessions are also the first ones to expire."""
 
-    def __init__(self, sleep_interval):
-        """Initialize variables in SessionManager's parent classes."""
-        threading.Thread.__init__(self)
-        threading._RLock.__init__(self)
+    SHARDS = 16     # Default number of independently locked shards.
+
+    def __init__(self, sleep_interval, shards=SHARDS):
+        """Initialize the thread and create the empty shards."""
+        super().__init__()
         self.__sleep_interval = sleep_interval
+        self.__shards = tuple(_Shard() for _ in range(shards))
+
+    def __shard(self, key):
+        """Find the shard that is responsible for storing the key."""
+        return self.__shards[hash(key) % len(self.__shards)]
 
     def run(self):
         """Remove old sessions from memory as needed.
@@ -46,15 +58,57 @@ class SessionManager(async_exc.Thread, threading._RLock, dict):
         routine begins, it must run until the program terminates."""
         while True:
             time.sleep(self.__sleep_interval)
-            with self:
-                for key in tuple(self):
-                    if not super().__getitem__(key):
-                        del self[key]
+            self.clean()
+
+    def clean(self):
+        """Remove the sessions that have outlived their time to live.
+
+        Since shards are ordered by last access, expired sessions are popped
+        from the front of each shard until a live one is found. The work done
+        is proportional to the number of expired sessions, not to all of the
+        sessions. They are only destroyed after the mutex has been released."""
+        for shard in self.__shards:
+            with shard.mutex:
+                expired = shard.trim()
+            del expired
+
+    def obtain(self, key, factory, *args):
+        """Get the session for the key or create it if it is missing.
+
+        The factory is called with the given arguments to create a new
+        session while the shard is locked, so that only one is ever made."""
+        shard = self.__shard(key)
+        with shard.mutex:
+            session, expired = shard.find(key)
+            if session is None:
+                session = shard[key] = factory(*args)
+                session.manager = self
+        del expired
+        return session
+
+    def get(self, key, default=None):
+        """Retrieve the session for the key if it is present."""
+        shard = self.__shard(key)
+        with shard.mutex:
+            session, expired = shard.find(key)
+        del expired
+        return default if session is None else session
+
+    def pop(self, key, default=None):
+        """Remove the session for the key and return it if it was present."""
+        shard = self.__shard(key)
+        with shard.mutex:
+            return shard.pop(key, default)
 
     def __setitem__(self, key, value):
         """Add manager attribute to value before storing it."""
         value.manager = self
-        super().__setitem__(key, value)
+        shard = self.__shard(key)
+        with shard.mutex:
+            # Any replaced session is destroyed after the mutex is released.
+            replaced = shard.pop(key, None)
+            shard[key] = value
+        del replaced
 
     def __getitem__(self, key):
         """Retrieve the session specified by the given key.
@@ -62,13 +116,103 @@ class SessionManager(async_exc.Thread, threading._RLock, dict):
         Like a normal dictionary, the value is returned to the caller
         if it was found. However, the wakeup method on the session is
         called first. This effectively delays the session's deletion."""
-        session = super().__getitem__(key)
+        shard = self.__shard(key)
+        with shard.mutex:
+            session, expired = shard.find(key)
+        del expired
+        if session is None:
+            raise KeyError(key)
+        return session
+
+    def __delitem__(self, key):
+        """Remove the session specified by the given key."""
+        shard = self.__shard(key)
+        with shard.mutex:
+            session = shard.pop(key)
+        del session
+
+    def __contains__(self, key):
+        """Check whether a live session is stored for the given key."""
+        shard = self.__shard(key)
+        with shard.mutex:
+            return bool(shard.get(key))
+
+    def __len__(self):
+        """Count the sessions that are stored in all of the shards."""
+        return sum(map(len, self.__shards))
+
+
+class _Shard(collections.OrderedDict):
+    """Hold one part of the sessions kept by a SessionManager.
+
+    Sessions are kept in the order that they were last accessed. The methods
+    here should only be called by the manager while the mutex is acquired."""
+
+    def __init__(self):
+        """Initialize an empty shard along with the mutex guarding it."""
+        super().__init__()
+        self.mutex = threading.Lock()
+
+    def find(self, key):
+        """Find a live session for the key and mark it as recently used.
+
+        The session is returned first, or None if it was not found. When the
+        session has expired, it is removed and returned second for the caller
+        to release; otherwise, the second value returned is always None."""
+        session = self.get(key)
+        if session is None:
+            return None, None
+        if not session:
+            return None, self.pop(key)
         session.wakeup()
+        self.move_to_end(key)
+        return session, None
+
+    def trim(self):
+        """Remove and return the expired sessions at the front of the shard."""
+        expired = []
+        for key, session in self.items():
+            if session:
+                break
+            expired.append(key)
+        return [self.pop(key) for key in expired]
+
+
+class SharedSessionManager(SessionManager):
+    """Manage sessions whose data is shared with other processes.
+
+    Session data is kept in a store such as session_store.SessionStore,
+    which needs load, save, delete, and purge methods. The sessions in the
+    dictionary act as local copies of the data that the store is keeping."""
+
+    def __init__(self, sleep_interval, store):
+        """Initialize the manager with the store holding session data."""
+        super().__init__(sleep_interval)
+        self.__store = store
+
+    def load(self, key):
+        """Get the data saved for the key if it has not expired yet."""
+        return self.__store.load(key)
+
+    def save(self, key, data):
+        """Store the data for the key and refresh its time to live."""
+        self.__store.save(key, data)
+
+    def pop(self, key, default=None):
+        """Remove the session both here and in the shared store."""
+        session = super().pop(key, default)
+        self.__store.delete(key)
         return session
 
-    def __hash__(self):
-        """Compute a hash as required by Thread objects."""
-        return id(self)
+    def __delitem__(self, key):
+        """Delete the session both here and in the shared store."""
+        super().__delitem__(key)
+        self.__store.delete(key)
+
+    def clean(self):
+        """Remove expired sessions here and in the shared store."""
+        super().clean()
+        self.__store.purge()
 
 
 class Session:
@@ -77,9 +221,16 @@ class Session:
     The only functionality this class directly supports is calling an event
     handler when the instance is destroyed. Session objects given to a
     SessionManager are automatically cleared out of memory when their "time to
-    live" is exceeded. The manager must be started for such functionality."""
+    live" is exceeded. The manager must be started for such functionality.
+    Instances use slots to stay small; subclasses may add their own slots
+    for any other session variables that they need to store in the session."""
 
-    __time = None   # Create a default value.
+    __slots__ = (
+        '__time_to_live',
+        '__on_destroyed',
+        '__time',
+        'manager'
+    )
 
     def __init__(self, time_to_live, on_destroyed=None):
         """Initialize timeout setting and deletion handler."""
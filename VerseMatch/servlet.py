@@ -5,21 +5,34 @@
 The code in this module provides an incomplete port of Java's API for
 servlets. Only essential classes and methods are implemented here."""
 
+import atexit
 import cgitb
 import datetime
+import functools
+import gzip
+import html
 import http.server
 import io
+import multiprocessing
+import queue
+import re
+import selectors
 import shutil
 import socket
 import socketserver
 import sys
+import threading
+import time
 import urllib.parse
 import webbrowser
 
+import tracing
+
 # Public Names
 __all__ = (
     'HttpServlet',
-    'HttpServer'
+    'HttpServer',
+    'HttpPoolServer'
 )
 
 # Module Documentation
@@ -42,17 +55,229 @@ class HttpServlet(http.server.BaseHTTPRequestHandler):
     protocol_version = 'HTTP/1.1'
 
     __debug = False                 # Determines how exceptions are reported.
+    __NO_BODY = frozenset({204, 304})   # Status codes sent without a body.
+    __gzip_mutex = threading.Lock()
+    __gzip_totals = [0, 0, 0]       # Responses, bytes before, bytes after.
     block_favicon_request = True    # Original behavior of the class.
+    compress_minimum = 1024         # Smallest body that will be compressed.
+    compress_level = 6              # Level that gzip compression uses.
+    chunk_size = 8192               # Bytes buffered between chunks sent.
+    timeout = 15                    # Seconds an idle connection is kept.
+    max_requests = 100              # Requests answered on one connection.
+    drain_limit = 1 << 16           # Most body bytes discarded to keep alive.
+    max_body_size = 1 << 20         # Largest request body that is accepted.
+    read_size = 8192                # Bytes of a request body read at once.
+    __reuse_mutex = threading.Lock()
+    __reuse_totals = [0, 0, 0]      # Connections, requests, requests reusing.
+    __parsed = False                # Was the current request understood?
+    __closing = False               # Must the connection close afterwards?
+    __consumed = False              # Was the request body read or refused?
+    __served = 0                    # Responses sent on this connection.
+    __record = None                 # What the access log is told of a request.
+    __started = 0.0                 # When the current request was parsed.
+    __chunking = 0.0                # Time spent sending chunks in service.
+    access_log = None               # AccessLog used instead of stderr if set.
+    SETTINGS = ('block_favicon_request', 'compress_minimum', 'compress_level',
+                'chunk_size', 'timeout', 'max_requests', 'drain_limit',
+                'max_body_size', 'read_size', 'access_log')
+
+    @classmethod
+    def settings(cls):
+        """Get the configuration of the servlet class as a dictionary.
+
+        Worker processes that are spawned instead of forked import the
+        classes again, so anything changed on them at run time is lost
+        unless these settings are sent along and given to configure."""
+        settings = {name: getattr(cls, name) for name in cls.SETTINGS}
+        settings['debug'] = cls.__debug
+        return settings
+
+    @classmethod
+    def configure(cls, settings):
+        """Apply settings that were taken from the settings method."""
+        for name, value in settings.items():
+            if name == 'debug':
+                cls.debug(value)
+            else:
+                setattr(cls, name, value)
+
+    @classmethod
+    def compression(cls):
+        """Report how much the bodies of responses have been compressed.
+
+        The totals cover every body that this process compressed, and bodies
+        compressed once to be cached are only counted that one time. The
+        ratio is the compressed size of the bodies divided by their original
+        size, or None if nothing was compressed."""
+        with cls.__gzip_mutex:
+            responses, before, after = cls.__gzip_totals
+        return dict(responses=responses, original=before, compressed=after,
+                    ratio=after / before if before else None)
 
     @classmethod
-    def debug(cls, value):
+    def connections(cls):
+        """Report how often clients have kept their connections alive.
+
+        The totals cover every connection that this process has handled.
+        Requests that were sent on a connection after its first are counted
+        as reused, and the ratio is the share of all requests that reused one,
+        or None if no requests have been answered yet."""
+        with cls.__reuse_mutex:
+            connections, requests, reused = cls.__reuse_totals
+        return dict(connections=connections, requests=requests, reused=reused,
+                    ratio=reused / requests if requests else None)
+
+    @staticmethod
+    def compressible(content_type):
+        """Decide if data of the content type is worth compressing."""
+        kind = content_type.split(';', 1)[0].strip().lower()
+        return (kind.startswith('text/') or
+                kind.endswith(('+xml', '+json')) or
+                kind in {'application/javascript', 'application/json',
+                         'application/xml'})
+
+    @classmethod
+    def debug(cls, value=None):
         """Set the debugging status of servlet applications.
 
         This determines what happens when code raises an exception.
         if True: traceback is sent back to the browser for analysis.
-        if False: the browser receives an ambiguous 500 error code."""
+        if False: the browser receives an ambiguous 500 error code.
+        if None: the status is left alone and is returned instead."""
+        if value is None:
+            return cls.__debug
         cls.__debug = value
 
+    def handle(self):
+        """Handle requests on the connection until it is closed or used up.
+
+        Servers that can watch idle connections, like HttpPoolServer, have
+        resume and park methods. Such a server is handed the connection when
+        the next request has not arrived yet instead of having this thread
+        wait on it, and it resumes the connection with a new handler later."""
+        resume = getattr(self.server, 'resume', None)
+        served = None if resume is None else resume(self.connection)
+        if served is None:
+            with self.__reuse_mutex:
+                self.__reuse_totals[0] += 1
+            served = 0
+        self.__served = served
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if resume is not None and self.__idle():
+                self.server.park(self.connection, self.__served)
+                return
+            self.handle_one_request()
+
+    def __idle(self):
+        """Check without waiting if the next request has yet to arrive."""
+        self.connection.setblocking(False)
+        try:
+            return not self.rfile.peek(1)
+        except OSError:
+            return True
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def handle_one_request(self):
+        """Handle a request after forgetting what the last one needed.
+
+        When there is an access log, it is given a record of the request
+        once the response has been sent, including how long it all took.
+        Requests that fail before they are parsed, such as one that gets a
+        414, are timed from here instead of from when they were parsed."""
+        self.__parsed = self.__closing = self.__consumed = False
+        self.__record = None
+        self.__started = time.perf_counter()
+        super().handle_one_request()
+        if self.__record is not None and self.access_log is not None:
+            self.__record['total'] = time.perf_counter() - self.__started
+            self.access_log.log(self.__record)
+
+    def parse_request(self):
+        """Parse the request and remember if it could be understood."""
+        self.__started = time.perf_counter()
+        self.__parsed = super().parse_request()
+        return self.__parsed
+
+    def log_request(self, code='-', size='-'):
+        """Log the request to stderr or start its record for the access log."""
+        if self.access_log is None:
+            super().log_request(code, size)
+        else:
+            self.__record = dict(time=time.time(),
+                                 client=self.address_string(),
+                                 request=self.requestline,
+                                 status=int(code),
+                                 size=None if size == '-' else size)
+
+    def __note(self, **values):
+        """Add the values to the access log's record of the request."""
+        if self.__record is not None:
+            self.__record.update(values)
+
+    def send_response(self, code, message=None):
+        """Send the status line and count the request it answers."""
+        super().send_response(code, message)
+        with self.__reuse_mutex:
+            self.__reuse_totals[1] += 1
+            if self.__served:
+                self.__reuse_totals[2] += 1
+        self.__served += 1
+
+    def end_headers(self):
+        """Finish the headers, saying if the connection will be closed.
+
+        Connections are closed once they have answered max_requests so
+        that no single client can hold on to a thread for too long. They
+        are also closed when the request had a body that was never read,
+        since the next request could not be found after it otherwise."""
+        if self.__closing or self.__served >= self.max_requests or \
+                self.__unread_body():
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
+    def __unread_body(self):
+        """Check if the request came with a body that was left unread."""
+        if self.__consumed or not self.__parsed:
+            return False
+        if 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            return True
+        try:
+            return int(self.headers.get('content-length', 0)) > 0
+        except ValueError:
+            return True
+
+    def send_error(self, code, message=None, explain=None):
+        """Send and log an error page, keeping the connection if possible.
+
+        The base class always closes the connection after an error. That is
+        only needed when the request could not be parsed or its body was not
+        read, so the connection is left open for any other error."""
+        if self.close_connection or not self.__parsed:
+            self.__closing = True
+        short, long = self.responses.get(code, ('???', '???'))
+        if message is None:
+            message = short
+        if explain is None:
+            explain = long
+        self.log_error('code %d, message %s', code, message)
+        self.send_response(code, message)
+        body = b''
+        if code >= 200 and code not in self.__NO_BODY | {205}:
+            body = (self.error_message_format % dict(
+                code=code,
+                message=html.escape(message, quote=False),
+                explain=html.escape(explain, quote=False)
+            )).encode('utf-8', 'replace')
+            self.send_header('Content-Type', self.error_content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.__note(size=len(body))
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+
     # noinspection PyPep8Naming
     def do_GET(self):
         """Handle the GET method sent via HTTP."""
@@ -64,64 +289,238 @@ class HttpServlet(http.server.BaseHTTPRequestHandler):
     # noinspection PyPep8Naming
     def do_POST(self):
         """Handle the POST method sent via HTTP."""
-        # noinspection PyBroadException,PyPep8
+        # The body is either read below or the connection gets closed.
+        self.__consumed = True
         try:
             length = int(self.headers.get('content-length'))
-        except:
-            self.send_error(411)
+            if length < 0:
+                raise ValueError(length)
+        except (TypeError, ValueError):
+            self.__refuse_body()
         else:
-            self.__call_service('?' + self.rfile.read(length).decode())
+            if length > self.max_body_size:
+                # A body this large is not worth reading just to throw away.
+                self.__closing = True
+                self.send_error(413)
+                return
+            form = self.read_form(self.rfile, length, self.read_size)
+            if form is None:
+                self.__closing = True
+                self.send_error(400, 'Request body ended early')
+            else:
+                self.__call_service('', form)
+
+    @staticmethod
+    def read_form(file, length, read_size=8192):
+        """Read a form from the request body in pieces without decoding it.
+
+        The body is split into its fields as it arrives instead of being
+        joined into one string. The fields are left as bytes to be decoded
+        by the request if they are needed. A short body gives back None."""
+        fields, partial = [], []
+        while length:
+            data = file.read(min(length, read_size))
+            if not data:
+                return None
+            length -= len(data)
+            cut = data.rfind(b'&')
+            if cut < 0:
+                partial.append(data)
+            else:
+                partial.append(data[:cut])
+                fields.extend(b''.join(partial).split(b'&'))
+                partial = [data[cut + 1:]]
+        fields.append(b''.join(partial))
+        return [field for field in fields if field]
 
-    def __call_service(self, query):
+    def __refuse_body(self):
+        """Answer a POST without a usable length, keeping alive if possible.
+
+        A chunked body is read and thrown away so that the next request on
+        the connection can be found after it. A request without a body needs
+        nothing done, but a bad length means the connection must be closed."""
+        coding = self.headers.get('transfer-encoding', '').lower()
+        if 'chunked' in coding:
+            self.__closing = not self.__drain_chunks()
+        elif 'content-length' in self.headers or coding:
+            self.__closing = True
+        self.send_error(411)
+
+    def __drain_chunks(self):
+        """Discard a chunked body and report if it all could be read."""
+        drained = 0
+        try:
+            while True:
+                size = int(self.rfile.readline(80).split(b';', 1)[0], 16)
+                drained += size
+                if size < 0 or drained > self.drain_limit:
+                    return False
+                if not size:
+                    break
+                if len(self.rfile.read(size + 2)) != size + 2:
+                    return False
+            while self.rfile.readline(self.drain_limit).strip():
+                pass    # Skip any trailer fields after the last chunk.
+        except ValueError:
+            return False
+        return True
+
+    @tracing.traced('HttpServlet.service', root=True)
+    def __call_service(self, query, form=None):
         """Execute service method implemented by child class.
 
         When either a GET or POST request is received, this method is
-        called with a string representing the query. Request and response
-        objects are created for the child's service method, and an answer
-        is sent back to the client with errors automatically being caught."""
-        request = _HttpServletRequest(query)
-        response = _HttpServletResponse()
+        called with a string representing the query and, for a POST, the
+        fields of its form. Request and response objects are created for
+        the child's service method, and an answer is sent back to the
+        client with errors automatically being caught."""
+        request = _HttpServletRequest(query, self.headers, form)
+        response = _HttpServletResponse(
+            None if self.request_version == 'HTTP/1.0' else self.__send_chunk,
+            self.chunk_size
+        )
+        start = time.perf_counter()
+        self.__chunking = 0.0
         # noinspection PyBroadException
         try:
             self.service(request, response)
         except Exception:
-            if self.__debug:
-                self.send_response(500)
-                self.send_header('Content-Type', 'text/html')
-                self.send_header('Connection', 'close')
-                self.end_headers()
+            # noinspection PyProtectedMember
+            if response._committed:
+                # The headers were sent, so the client can only be cut off.
+                self.close_connection = True
+                self.log_error('%r raised after the response was committed',
+                               sys.exc_info()[1])
+            elif self.__debug:
                 klass, value, trace = sys.exc_info()
-                # The next function call may raise an exception.
-                html = cgitb.html((klass, value, trace.tb_next))
-                self.wfile.write(html.encode())
+                # noinspection PyBroadException
+                try:
+                    page = cgitb.html((klass, value, trace.tb_next)).encode()
+                except Exception:
+                    self.send_error(500)
+                else:
+                    self.send_response(500)
+                    self.send_header('Content-Type', 'text/html')
+                    self.send_header('Content-Length', str(len(page)))
+                    self.end_headers()
+                    self.__note(size=len(page))
+                    self.wfile.write(page)
             else:
                 self.send_error(500)
         else:
-            self.__send_response(response)
+            # noinspection PyProtectedMember
+            render = response._timings.get('render', 0.0)
+            serviced, chunking = time.perf_counter(), self.__chunking
+            self.__send_response(request, response)
+            # Chunks sent while servicing count as sending, not service.
+            self.__note(service=serviced - start - render - chunking,
+                        render=render,
+                        send=time.perf_counter() - serviced + chunking)
+            if response._committed:
+                self.__note(chunked=True)
 
     # noinspection PyProtectedMember
-    def __send_response(self, response):
+    def __send_response(self, request, response):
         """Transfer data from _HttpServletResponse instance to client.
 
         A response value is always expected, but a binary payload can
         follow textual information if given. The payload is simply
-        concatenated onto the end of the data that is being sent."""
+        concatenated onto the end of the data that is being sent.
+        A payload that is a bytes-like object is written out directly.
+        Responses with a status that does not allow a body get none.
+        Bodies held in memory are compressed when the client accepts gzip,
+        the content type is compressible, and they are large enough, unless
+        the response was already encoded or was marked as not compressible.
+        A chunked response that was already started is finished instead."""
+        if response._committed:
+            self.__finish_chunks(response)
+            return
+        self.send_response(response._status)
+        headers = response._headers
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if response._status in self.__NO_BODY:
+            self.end_headers()
+            return
         response_value = response._value
         content_length = len(response_value)
-        if response._binary_payload:
-            cur = response._binary_payload.tell()
-            response._binary_payload.seek(0, io.SEEK_END)
-            end = response._binary_payload.tell()
-            response._binary_payload.seek(cur, io.SEEK_SET)
+        payload = response._binary_payload
+        if payload is not None and not hasattr(payload, 'read'):
+            payload = memoryview(payload)
+            content_length += payload.nbytes
+        elif payload:
+            cur = payload.tell()
+            payload.seek(0, io.SEEK_END)
+            end = payload.tell()
+            payload.seek(cur, io.SEEK_SET)
             content_length += end - cur
-        self.send_response(200)
+        if (payload is None or isinstance(payload, memoryview)) and \
+                'Content-Encoding' not in headers and \
+                response._compressible and self.compressible(response._type):
+            if 'Vary' not in headers:
+                self.send_header('Vary', 'Accept-Encoding')
+            if content_length >= self.compress_minimum and \
+                    request.accepts_encoding('gzip'):
+                response_value = self.compress(
+                    response_value if payload is None else
+                    b''.join((response_value, payload)))
+                payload = None
+                content_length = len(response_value)
+                self.send_header('Content-Encoding', 'gzip')
         self.send_header('Content-Type', response._type)
         self.send_header('Content-Length', str(content_length))
         self.end_headers()
+        self.__note(size=content_length)
         self.wfile.write(response_value)
-        if response._binary_payload:
-            shutil.copyfileobj(response._binary_payload, self.wfile)
-            response._binary_payload.close()
+        if isinstance(payload, memoryview):
+            self.wfile.write(payload)
+        elif payload:
+            shutil.copyfileobj(payload, self.wfile)
+            payload.close()
+
+    # noinspection PyProtectedMember
+    def __send_chunk(self, response, data):
+        """Send part of a chunked body, sending the headers before it.
+
+        The first call commits the response, so its status and headers
+        cannot be changed afterwards. Empty data is never sent as a chunk
+        since a chunk with no data marks the end of the response body.
+        The time spent sending is added up for the access log's record."""
+        start = time.perf_counter()
+        if not response._committed:
+            self.send_response(response._status)
+            for name, value in response._headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', response._type)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            response._commit()
+        if data:
+            self.wfile.write(b'%X\r\n%b\r\n' % (len(data), data))
+        self.__chunking += time.perf_counter() - start
+
+    # noinspection PyProtectedMember
+    def __finish_chunks(self, response):
+        """Send the rest of a chunked response followed by the last chunk."""
+        response.getWriter().flush()
+        payload = response._binary_payload
+        if payload is not None and not hasattr(payload, 'read'):
+            self.__send_chunk(response, payload)
+        elif payload:
+            for data in iter(lambda: payload.read(self.chunk_size), b''):
+                self.__send_chunk(response, data)
+            payload.close()
+        self.wfile.write(b'0\r\n\r\n')
+
+    @classmethod
+    def compress(cls, body):
+        """Compress the whole body of a response and count the savings."""
+        compressed = gzip.compress(body, cls.compress_level, mtime=0)
+        with cls.__gzip_mutex:
+            cls.__gzip_totals[0] += 1
+            cls.__gzip_totals[1] += len(body)
+            cls.__gzip_totals[2] += len(compressed)
+        return compressed
 
     def service(self, request, response):
         """Process the client's request and send back a response."""
@@ -135,10 +534,40 @@ class _HttpServletRequest:
     to store query variables obtained by parsing the
     path or post data sent from the client to the servlet."""
 
-    def __init__(self, path):
-        """Initialize the request object from the path."""
+    def __init__(self, path, headers=None, form=None):
+        """Initialize the request object from the path and headers.
+
+        A form is given as the undecoded fields of a POST request's body.
+        Neither the form nor the query is decoded until a parameter is
+        needed, so requests that never look at them do not pay for it."""
         self.__results = urllib.parse.urlparse(path)
-        self.__dict = urllib.parse.parse_qs(self.query, True)
+        self.__headers = {} if headers is None else headers
+        self.__form = form
+        self.__dict = None
+
+    def __parameters(self):
+        """Decode the parameters from the form if given or else the query."""
+        if self.__form is None:
+            return urllib.parse.parse_qs(self.query, True)
+        parameters = {}
+        for field in self.__form:
+            name, _, value = field.replace(b'+', b' ').partition(b'=')
+            parameters.setdefault(self.__unquote(name), []).append(
+                self.__unquote(value))
+        return parameters
+
+    @staticmethod
+    def __unquote(data):
+        """Decode a form field's name or value the same way as parse_qs."""
+        return urllib.parse.unquote_to_bytes(data).decode('utf-8', 'replace')
+
+    # noinspection PyPep8Naming
+    def getHeader(self, name):
+        """Get the value of the named request header.
+
+        Header names are not case sensitive. If the client did not
+        send the header, then None is returned instead of an error."""
+        return self.__headers.get(name)
 
     # noinspection PyPep8Naming
     def getParameter(self, name):
@@ -148,8 +577,32 @@ class _HttpServletRequest:
         and the first value associated with that name is
         returned. If the name cannot be found, then None
         is returned to the caller instead of an exception."""
+        if self.__dict is None:
+            self.__dict = self.__parameters()
         return self.__dict.get(name, [None])[0]
 
+    def accepts_encoding(self, coding):
+        """Check if the client accepts a response encoded with the coding.
+
+        The Accept-Encoding header is searched for the coding or for "*",
+        and a coding that was given a quality of zero is not acceptable."""
+        header = self.getHeader('Accept-Encoding')
+        if header is None:
+            return False
+        quality = {}
+        for item in header.split(','):
+            name, *parameters = item.split(';')
+            value = 1.0
+            for parameter in parameters:
+                key, _, number = parameter.partition('=')
+                if key.strip().lower() == 'q':
+                    try:
+                        value = float(number)
+                    except ValueError:
+                        value = 0.0
+            quality[name.strip().lower()] = value
+        return quality.get(coding, quality.get('*', 0.0)) > 0
+
     def __getattr__(self, name):
         """Get an attribute from the parse result.
 
@@ -165,11 +618,65 @@ class _HttpServletResponse:
     instance of this class. It allows the responses to be configured
     for both the type of data and the content of the data being sent."""
 
-    def __init__(self):
-        """Initialize a blank, generic response object."""
+    def __init__(self, send_chunk=None, chunk_size=8192):
+        """Initialize a blank, generic response object.
+
+        The send_chunk function is given by servlets whose client can take
+        a chunked response. It is called with the response and the data of
+        each chunk once setChunked has been called and chunk_size is hit."""
+        self.__status = 200
+        self.__headers = {}
         self.__content_type = 'text/plain'
         self.__print_writer = _PrintWriter()
         self.__binary_payload = None
+        self.__send_chunk = send_chunk
+        self.__chunk_size = chunk_size
+        self.__committed = False
+        self.__timings = {}
+        self.__compressible = True
+
+    # noinspection PyPep8Naming
+    def setChunked(self, chunked=True):
+        """Choose whether the body is sent in chunks while it is printed.
+
+        A chunked response starts being sent when enough has been printed,
+        so the status and headers must be set before printing. If the whole
+        body fits in one chunk, it is sent as usual with its length instead.
+        Clients that do not understand chunked responses are unaffected."""
+        if self.__send_chunk is not None and not self.__committed:
+            # noinspection PyProtectedMember
+            self.__print_writer._stream(
+                functools.partial(self.__send_chunk, self),
+                self.__chunk_size if chunked else None)
+
+    # noinspection PyPep8Naming
+    def setCompressible(self, compressible=True):
+        """Choose whether the servlet may compress the body when sending it.
+
+        Bodies that are already known to compress poorly can be sent as they
+        are without being compressed again, and without a Vary header."""
+        self.__compressible = compressible
+
+    # noinspection PyPep8Naming
+    def flushBuffer(self):
+        """Send everything printed so far if the response is chunked."""
+        self.__print_writer.flush()
+
+    # noinspection PyPep8Naming
+    def setStatus(self, status):
+        """Set the status code of the response sent to the client.
+
+        The status is 200 unless it is changed. No body is sent for
+        statuses such as 304 (Not Modified) that must not have one."""
+        self.__status = status
+
+    # noinspection PyPep8Naming
+    def setHeader(self, name, value):
+        """Set a header to send back to the client with the response.
+
+        Setting a header again replaces the value given before it. The
+        content type and length are sent separately and cannot be set."""
+        self.__headers[name] = value
 
     # noinspection PyPep8Naming
     def setContentType(self, content_type):
@@ -196,9 +703,38 @@ class _HttpServletResponse:
 
         This method provides setting a file object that can be
         used to pass binary data back to the client. All binary data
-        follows any textual data that was given via a _PrintWriter."""
+        follows any textual data that was given via a _PrintWriter.
+        A bytes-like object may be given instead of a file object."""
         self.__binary_payload = file
 
+    # noinspection PyPep8Naming
+    def setTiming(self, phase, seconds):
+        """Record how long a phase of making the response took.
+
+        The time spent rendering is given as the render phase so that the
+        access log can show it apart from the rest of the service method."""
+        self.__timings[phase] = seconds
+
+    @property
+    def _timings(self):
+        """Read-only phase-timings property for __call_service."""
+        return self.__timings
+
+    @property
+    def _compressible(self):
+        """Read-only compression-allowed property for __send_response."""
+        return self.__compressible
+
+    @property
+    def _status(self):
+        """Read-only status-code property for __call_service."""
+        return self.__status
+
+    @property
+    def _headers(self):
+        """Read-only extra-headers property for __call_service."""
+        return self.__headers
+
     @property
     def _type(self):
         """Read-only content-type property for __call_service."""
@@ -207,9 +743,16 @@ class _HttpServletResponse:
     @property
     def _value(self):
         """Read-only response-value property for __call_service."""
-        value = self.__print_writer.getvalue()
-        lines = value.replace('\r\n', '\n').replace('\r', '\n')
-        return lines.replace('\n', '\r\n').encode()
+        return self.__print_writer.getbytes()
+
+    @property
+    def _committed(self):
+        """Read-only property telling if the headers were already sent."""
+        return self.__committed
+
+    def _commit(self):
+        """Record that the status and headers have been sent."""
+        self.__committed = True
 
     @property
     def _binary_payload(self):
@@ -217,18 +760,65 @@ class _HttpServletResponse:
         return self.__binary_payload
 
 
-class _PrintWriter(io.StringIO):
+class _PrintWriter:
     """Cache the response generated for the client.
 
     An instance of the class is automatically built by HTTP Servlet
-    Response objects to cache the data being sent back to the client."""
+    Response objects to cache the data being sent back to the client.
+    Text is encoded as it is printed, and every line ending is turned
+    into a carriage return and line feed on the way into the buffer."""
+
+    __NEWLINE = re.compile(r'\r\n|\r|\n')
+
+    def __init__(self):
+        """Initialize an empty buffer that is not being streamed."""
+        self.__buffer = bytearray()
+        self.__carriage_return = False
+        self.__flush = None
+        self.__limit = None
+
+    def _stream(self, flush, limit):
+        """Hand the buffer to flush whenever it grows to the limit.
+
+        A limit of None stops the streaming again. The flush function is
+        called with the buffered data, and the buffer is emptied after."""
+        self.__flush = None if limit is None else flush
+        self.__limit = limit
 
-    print = io.StringIO.write
+    def write(self, string):
+        """Encode the string into the buffer with normalized line endings.
+
+        A carriage return at the end of one string and a line feed at the
+        start of the next are treated as a single line ending together."""
+        if self.__carriage_return and string.startswith('\n'):
+            string = string[1:]
+        self.__carriage_return = string.endswith('\r')
+        if string:
+            self.__buffer += self.__NEWLINE.sub('\r\n', string).encode()
+            if self.__flush is not None and \
+                    len(self.__buffer) >= self.__limit:
+                self.flush()
+
+    print = write
 
     def println(self, string):
         """Print a line of data to the internal representation."""
         self.write(string + '\r\n')
 
+    def flush(self):
+        """Send the buffered data on if the writer is being streamed."""
+        if self.__flush is not None and self.__buffer:
+            data, self.__buffer = self.__buffer, bytearray()
+            self.__flush(data)
+
+    def getbytes(self):
+        """Get a copy of the encoded data that is still in the buffer.
+
+        This is not named getvalue since the data is bytes instead of the
+        text a StringIO would give, so old callers fail instead of mixing
+        them up. A copy is made so that later writes do not change it."""
+        return bytes(self.__buffer)
+
 
 class HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
     """Create a server with specified address and handler.
@@ -243,15 +833,46 @@ class HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
     # We should not be binding to an
     # address that is already in use.
     allow_reuse_address = False
+    allow_reuse_port = False        # Only set by pre-forked workers.
+    SETTINGS = ()                   # Class attributes given to workers.
+
+    @classmethod
+    def settings(cls):
+        """Get the configuration of the server class as a dictionary."""
+        return {name: getattr(cls, name) for name in cls.SETTINGS}
+
+    @classmethod
+    def configure(cls, settings):
+        """Apply settings that were taken from the settings method."""
+        for name, value in settings.items():
+            setattr(cls, name, value)
+
+    def report(self):
+        """Print anything worth knowing about the server when it stops."""
 
     # noinspection PyPep8Naming
     @classmethod
-    def main(cls, RequestHandlerClass, port=80):
+    def main(cls, RequestHandlerClass, port=80, workers=1,
+             initializer=None, initargs=()):
         """Start server with handler on given port.
 
         This static method provides an easy way to start, run, and exit
         a HttpServer instance. The server will be executed if possible,
-        and the computer's web browser will be directed to the address."""
+        and the computer's web browser will be directed to the address.
+        When several workers are requested, the server is pre-forked into
+        that many processes that share the port. The initializer is called
+        with initargs in every process that handles requests, before any of
+        them are accepted, so that threads are never started before forking.
+        Platforms without SO_REUSEPORT are always served by one process."""
+        if workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            print('SO_REUSEPORT is not supported, so only one process is used')
+            workers = 1
+        if workers > 1:
+            cls.__prefork(RequestHandlerClass, port, workers,
+                          initializer, initargs)
+            return
+        if initializer is not None:
+            initializer(*initargs)
         server = None
         try:
             server = cls(('', port), RequestHandlerClass)
@@ -262,17 +883,63 @@ class HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
             addr, port = server.socket.getsockname()
             print('Serving HTTP on', addr, 'port', port, '...')
         finally:
-            port = '' if port == 80 else f':{port}'
-            addr = 'http://localhost' + port + '/'
-            webbrowser.open(addr)
+            cls.__open_browser(port)
         if active:
             try:
                 server.serve_forever()
             except KeyboardInterrupt:
                 print('Keyboard interrupt received: EXITING')
             finally:
+                server.report()
                 server.server_close()
 
+    # noinspection PyPep8Naming
+    @classmethod
+    def __prefork(cls, RequestHandlerClass, port, workers,
+                  initializer, initargs):
+        """Run several worker processes that all listen on the same port.
+
+        Each worker binds its own socket with SO_REUSEPORT set, and the
+        kernel spreads incoming connections across them. This process only
+        supervises the workers and waits for them to exit or be interrupted.
+        The workers are given everything they need as arguments, so they
+        work whether the processes are forked or spawned."""
+        processes = [multiprocessing.Process(
+            target=_serve_worker,
+            args=(cls, cls.settings(), RequestHandlerClass,
+                  RequestHandlerClass.settings(), port, initializer, initargs),
+            daemon=True
+        ) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        print('Serving HTTP on port', port, 'with', workers, 'processes ...')
+        cls.__open_browser(port)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            print('Keyboard interrupt received: EXITING')
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+    @staticmethod
+    def __open_browser(port):
+        """Direct the computer's web browser to the server's address."""
+        port = '' if port == 80 else f':{port}'
+        addr = 'http://localhost' + port + '/'
+        webbrowser.open(addr)
+
+    def server_bind(self):
+        """Bind the socket, sharing the port with other processes if allowed.
+
+        Setting allow_reuse_port lets several pre-forked server processes
+        bind the same address so the kernel can balance connections."""
+        if self.allow_reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
     def handle_error(self, request, client_address):
         """Process exceptions raised by the RequestHandlerClass.
 
@@ -283,6 +950,7 @@ class HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
         if klass is SystemExit:
             self.__exit = value
             self._BaseServer__serving = None
+            self._BaseServer__shutdown_request = True
         elif issubclass(klass, socket.error):
             pass
         else:
@@ -296,5 +964,262 @@ class HttpServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
         caught in the handle_error method above. This allows servlet
         code to terminate server execution if so desired or required."""
         super().serve_forever(poll_interval)
-        if self._BaseServer__serving is None:
+        if self.__exit is not None:
             raise self.__exit
+
+
+class HttpPoolServer(HttpServer):
+    """Create a server that handles clients with a fixed pool of threads.
+
+    Instead of starting a new thread for every connection, accepted sockets
+    are placed in a bounded queue that a constant number of worker threads
+    service. When the queue is full, the client is immediately told to come
+    back later with a 503 response instead of having another thread made.
+    Kept-alive connections waiting for their next request do not hold on to
+    a thread. A watcher thread selects on them and queues each one again
+    when a request arrives, closing those left idle past the handler's
+    timeout, so idle browsers cannot use the pool up by themselves."""
+
+    pool_size = 16              # Number of threads handling requests.
+    queue_depth = 32            # Connections allowed to wait for a thread.
+    request_queue_size = 64     # Backlog of connections the kernel accepts.
+    retry_after = 1             # Seconds rejected clients should wait.
+    join_timeout = 5            # Seconds closing waits for busy threads.
+    SETTINGS = ('pool_size', 'queue_depth', 'request_queue_size',
+                'retry_after', 'join_timeout')
+
+    # noinspection PyPep8Naming
+    def __init__(self, server_address, RequestHandlerClass,
+                 bind_and_activate=True):
+        """Initialize the server and start its pool of worker threads.
+
+        The pool is made first since a server that fails to bind is closed
+        before the base class gives the error back to the caller."""
+        self.__queue = queue.Queue(self.queue_depth)
+        self.__mutex = threading.Lock()
+        self.__busy = self.__accepted = self.__rejected = 0
+        self.__parking, self.__resumed, self.__pending = {}, {}, []
+        self.__idle = 0
+        self.__closed = False
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeup = socket.socketpair()
+        for end in self.__wakeup:
+            end.setblocking(False)
+        self.__selector.register(self.__wakeup[0], selectors.EVENT_READ)
+        self.__watcher = threading.Thread(target=self.__watch, daemon=True)
+        self.__watcher.start()
+        self.__workers = [threading.Thread(target=self.__work, daemon=True)
+                          for _ in range(self.pool_size)]
+        for worker in self.__workers:
+            worker.start()
+        super().__init__(server_address, RequestHandlerClass,
+                         bind_and_activate)
+
+    def process_request(self, request, client_address):
+        """Queue the request for a worker or reject it if overloaded."""
+        if self.__enqueue(request, client_address):
+            with self.__mutex:
+                self.__accepted += 1
+
+    def __enqueue(self, request, client_address):
+        """Queue a connection, rejecting it and reporting if it is full."""
+        try:
+            self.__queue.put_nowait((request, client_address))
+        except queue.Full:
+            with self.__mutex:
+                self.__rejected += 1
+                self.__resumed.pop(request, None)
+            self.__reject(request)
+            return False
+        return True
+
+    def __work(self):
+        """Handle queued requests until the server is closed."""
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+            request, client_address = item
+            with self.__mutex:
+                self.__busy += 1
+            # noinspection PyBroadException
+            try:
+                self.finish_request(request, client_address)
+            except BaseException:
+                # SystemExit and the like must not cost the pool a thread.
+                self.handle_error(request, client_address)
+                with self.__mutex:
+                    self.__parking.pop(request, None)
+            with self.__mutex:
+                self.__busy -= 1
+                served = self.__parking.pop(request, None)
+                parked = served is not None and not self.__closed
+                if parked:
+                    self.__pending.append((request, client_address, served))
+            if parked:
+                self.__wake()
+            else:
+                self.shutdown_request(request)
+
+    def park(self, request, served):
+        """Take an idle connection once its handler is done with it.
+
+        The handler calls this just before it returns, and the worker gives
+        the connection to the watcher instead of closing it afterwards."""
+        with self.__mutex:
+            self.__parking[request] = served
+
+    def resume(self, request):
+        """Get how many responses a resumed connection has already sent.
+
+        None is returned for a connection that was never parked, which lets
+        the handler count it as a new connection."""
+        with self.__mutex:
+            return self.__resumed.pop(request, None)
+
+    def __wake(self):
+        """Interrupt the watcher so that it looks at the pending list."""
+        try:
+            self.__wakeup[1].send(b'\0')
+        except OSError:
+            pass    # The watcher already has a wakeup waiting for it.
+
+    def __watch(self):
+        """Wait for parked connections to send requests or to time out."""
+        while True:
+            now = time.monotonic()
+            deadlines = [key.data[2] for key in
+                         self.__selector.get_map().values()
+                         if key.data and key.data[2] is not None]
+            wait = max(0.0, min(deadlines) - now) if deadlines else None
+            events = self.__selector.select(wait)
+            with self.__mutex:
+                pending, self.__pending = self.__pending, []
+                closed = self.__closed
+            if closed:
+                break
+            now = time.monotonic()
+            timeout = self.RequestHandlerClass.timeout
+            for request, client_address, served in pending:
+                self.__selector.register(request, selectors.EVENT_READ, (
+                    client_address, served,
+                    None if timeout is None else now + timeout))
+            for key, _ in events:
+                if key.data is None:
+                    try:
+                        while key.fileobj.recv(4096):
+                            pass
+                    except OSError:
+                        pass    # Every wakeup has been read.
+                    continue
+                self.__selector.unregister(key.fileobj)
+                try:
+                    # Clients that hung up are not worth a thread.
+                    closed = not key.fileobj.recv(1, socket.MSG_PEEK)
+                except OSError:
+                    closed = True
+                if closed:
+                    self.shutdown_request(key.fileobj)
+                    continue
+                client_address, served, _ = key.data
+                with self.__mutex:
+                    self.__resumed[key.fileobj] = served
+                self.__enqueue(key.fileobj, client_address)
+            for key in list(self.__selector.get_map().values()):
+                if key.data and key.data[2] is not None and \
+                        key.data[2] <= now:
+                    self.__selector.unregister(key.fileobj)
+                    self.shutdown_request(key.fileobj)
+            with self.__mutex:
+                self.__idle = len(self.__selector.get_map()) - 1
+
+    def __reject(self, request):
+        """Send a short 503 response on the socket and close it."""
+        response = (f'{HttpServlet.protocol_version} 503 '
+                    f'Service Unavailable\r\n'
+                    f'Retry-After: {self.retry_after}\r\n'
+                    f'Content-Length: 0\r\n'
+                    f'Connection: close\r\n\r\n')
+        try:
+            request.sendall(response.encode())
+        except socket.error:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """Stop the worker threads before closing the server's socket.
+
+        Connections still waiting for a thread or parked while idle are
+        closed, which also makes room for the signals to stop. Threads busy
+        with a client are only waited on for join_timeout seconds."""
+        with self.__mutex:
+            self.__closed = True
+        self.__wake()
+        self.__watcher.join(self.join_timeout)
+        for key in list(self.__selector.get_map().values()):
+            if key.data:
+                self.shutdown_request(key.fileobj)
+        with self.__mutex:
+            pending, self.__pending = self.__pending, []
+        for request, *_ in pending:
+            self.shutdown_request(request)
+        while True:
+            try:
+                item = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        for _ in self.__workers:
+            try:
+                self.__queue.put_nowait(None)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + self.join_timeout
+        for worker in self.__workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self.__selector.close()
+        for end in self.__wakeup:
+            end.close()
+        super().server_close()
+
+    def report(self):
+        """Print the pool's statistics when the server stops."""
+        print('Pool statistics:', ', '.join(
+            f'{name}={value}' for name, value in self.stats.items()))
+
+    @property
+    def stats(self):
+        """Read-only snapshot of the pool's size, load, and rejections."""
+        with self.__mutex:
+            return dict(pool_size=self.pool_size,
+                        busy=self.__busy,
+                        idle=self.__idle,
+                        queued=self.__queue.qsize(),
+                        queue_depth=self.queue_depth,
+                        accepted=self.__accepted,
+                        rejected=self.__rejected)
+
+
+# noinspection PyPep8Naming
+def _serve_worker(server_class, server_settings, RequestHandlerClass,
+                  settings, port, initializer, initargs):
+    """Initialize and run one pre-forked server process.
+
+    A process started by multiprocessing ends with os._exit, which skips
+    the atexit handlers, so they are run here to flush logs and traces."""
+    server_class.configure(server_settings)
+    RequestHandlerClass.configure(settings)
+    server_class.allow_reuse_port = True
+    if initializer is not None:
+        initializer(*initargs)
+    server = server_class(('', port), RequestHandlerClass)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.report()
+        server.server_close()
+        atexit._run_exitfuncs()
@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure how much memory is used by each VerseMatch session.
+
+This is a standalone program that simulates many clients connecting to the
+server at once. It reports the number of bytes allocated for each session."""
+
+import datetime
+import sys
+import tracemalloc
+
+import bible_verse
+import manager
+import verse_match_server
+from state import State
+
+# Public Names
+__all__ = (
+    'main',
+    'measure'
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+
+def main(count=100_000):
+    """Simulate the given number of sessions and report their sizes."""
+    session_size = measure(count, _create_sessions)
+    print(f'{count:,} sessions: {session_size:,.1f} bytes per session')
+    verse_size = measure(count, _create_verses)
+    print(f'{count:,} verses: {verse_size:,.1f} bytes per verse')
+
+
+def measure(count, create):
+    """Find the average number of bytes allocated for each object created.
+
+    The create function is called with the count and should return an object
+    that keeps everything it created alive until the measurement is done."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        keep_alive = create(count)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del keep_alive
+    return (after - before) / count
+
+
+def _create_sessions(count):
+    """Fill a session manager with new sessions for simulated clients."""
+    session_manager = manager.SessionManager(60)
+    for index in range(count):
+        ip = f'10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}'
+        session = verse_match_server.ClientSession(
+            verse_match_server.VerseMatch.SESSION_TTL)
+        session.state = State(session, None, None)
+        session.ip = ip
+        session.data = None
+        session_manager[ip] = session
+    return session_manager
+
+
+def _create_verses(count):
+    """Create verses that are the same as the ones given to clients."""
+    text = 'In the beginning God created the heaven and the earth.'
+    return [bible_verse.Verse(f'Genesis 1:{index}', text)
+            for index in range(count)]
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
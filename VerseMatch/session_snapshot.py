@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Periodically save session data so that a restarted server can use it.
+
+Sessions that changed are appended to a compact binary file at regular
+intervals, and the file is read back when the server starts up again."""
+
+import datetime
+import os
+import pathlib
+import struct
+import threading
+import time
+
+import async_exc
+
+# Public Names
+__all__ = (
+    'SessionSnapshot',
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+# Symbolic Constants
+_MAGIC = b'VMS1'
+_RECORD = struct.Struct('<dHI')     # touched, key length, data length
+
+
+class SessionSnapshot(async_exc.Thread):
+    """Keep an incremental snapshot of session data in a local file.
+
+    Data recorded for a key is held in memory until the next interval and
+    then appended to the file as a record holding the time, key, and data.
+    Records that were replaced by newer ones are dropped by compacting the
+    file once it grows to twice the size it had after it was last compacted.
+    Data found in the file at startup is kept as bytes until it is taken."""
+
+    COMPACT_MINIMUM = 1024  # Records allowed before compacting is considered.
+
+    def __init__(self, path, sleep_interval, time_to_live):
+        """Initialize the snapshot and load any data saved in the file."""
+        super().__init__()
+        self.__path = pathlib.Path(path)
+        self.__sleep_interval = sleep_interval
+        self.__time_to_live = time_to_live
+        self.__mutex = threading.Lock()
+        self.__writing = threading.Lock()
+        self.__pending = {}
+        self.__restored = self.__read()
+        self.__records = self.__limit = 0
+        self.__rewrite(self.__restored)
+
+    def run(self):
+        """Write the recorded data to the file after every interval."""
+        while True:
+            time.sleep(self.__sleep_interval)
+            self.write()
+
+    def record(self, key, data):
+        """Remember the data of the key for the next snapshot to include."""
+        with self.__mutex:
+            self.__pending[key] = time.time(), data
+
+    def take(self, key):
+        """Remove and return data restored for the key from an old snapshot.
+
+        Restored data is only handed out once since the caller is expected to
+        turn it into a live session. None is returned if nothing was found."""
+        with self.__mutex:
+            touched, data = self.__restored.pop(key, (None, None))
+        if touched is None or time.time() - touched > self.__time_to_live:
+            return None
+        return data
+
+    def write(self):
+        """Append the data recorded since the last snapshot to the file."""
+        with self.__writing:
+            with self.__mutex:
+                pending, self.__pending = self.__pending, {}
+            if pending:
+                with self.__path.open('ab') as file:
+                    file.write(b''.join(
+                        self.__encode(key, touched, data)
+                        for key, (touched, data) in pending.items()
+                    ))
+                self.__records += len(pending)
+            if self.__records > self.__limit:
+                self.__rewrite(self.__read())
+                self.__forget_expired()
+
+    def __forget_expired(self):
+        """Drop restored data that expired before it could be taken."""
+        expired = time.time() - self.__time_to_live
+        with self.__mutex:
+            self.__restored = {key: record for key, record in
+                               self.__restored.items() if record[0] >= expired}
+
+    def __rewrite(self, records):
+        """Replace the file with one that only holds the given records."""
+        temporary = self.__path.with_suffix('.tmp')
+        with temporary.open('wb') as file:
+            file.write(_MAGIC)
+            file.write(b''.join(
+                self.__encode(key, touched, data)
+                for key, (touched, data) in records.items()
+            ))
+        os.replace(temporary, self.__path)
+        self.__records = len(records)
+        self.__limit = max(self.COMPACT_MINIMUM, 2 * self.__records)
+
+    def __read(self):
+        """Read the records in the file that have not expired yet.
+
+        The data returned maps each key to a pair holding the time that the
+        data was recorded and the data itself. Only the newest record for a
+        key is kept, and a partially written record at the end is ignored."""
+        try:
+            buffer = self.__path.read_bytes()
+        except FileNotFoundError:
+            return {}
+        if not buffer.startswith(_MAGIC):
+            return {}
+        records, offset, end = {}, len(_MAGIC), len(buffer)
+        expired = time.time() - self.__time_to_live
+        while offset + _RECORD.size <= end:
+            touched, key_size, data_size = _RECORD.unpack_from(buffer, offset)
+            offset += _RECORD.size
+            if offset + key_size + data_size > end:
+                break
+            key = buffer[offset:offset + key_size].decode()
+            offset += key_size
+            data = buffer[offset:offset + data_size]
+            offset += data_size
+            if touched >= expired:
+                records[key] = touched, data
+            else:
+                records.pop(key, None)
+        return records
+
+    @staticmethod
+    def __encode(key, touched, data):
+        """Pack the parts of a single record into bytes."""
+        key = key.encode()
+        return _RECORD.pack(touched, len(key), len(data)) + key + data
@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Keep session data in a SQLite database that processes can share.
+
+A SharedSessionManager can be given any object with the same methods as
+SessionStore, but this one allows several servers to use one file at once."""
+
+import datetime
+import sqlite3
+import threading
+import time
+
+# Public Names
+__all__ = (
+    'SessionStore',
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+
+class SessionStore:
+    """Store serialized sessions in a SQLite database running in WAL mode.
+
+    Data that has been read or written is cached in memory along with the
+    version of its row. Loading a key only asks the database for the row's
+    version and time, and the data is read again when the version differs.
+    Saving data that did not change only refreshes its time to live once in
+    a while, so servers that are mostly reading rarely write to the file."""
+
+    def __init__(self, path, time_to_live, refresh_interval=60):
+        """Initialize the store and create its table if it is missing."""
+        self.__time_to_live = time_to_live
+        self.__refresh_interval = refresh_interval
+        self.__mutex = threading.Lock()
+        self.__cache = {}
+        self.__database = sqlite3.connect(
+            str(path), isolation_level=None, check_same_thread=False)
+        self.__database.execute('PRAGMA journal_mode = WAL')
+        self.__database.execute('PRAGMA synchronous = NORMAL')
+        self.__database.execute('''\
+CREATE TABLE IF NOT EXISTS session (
+  key     TEXT PRIMARY KEY,
+  touched REAL NOT NULL,
+  version INTEGER NOT NULL DEFAULT 0,
+  data    BLOB NOT NULL
+) WITHOUT ROWID''')
+        columns = {row[1] for row in self.__database.execute(
+            'PRAGMA table_info(session)')}
+        if 'version' not in columns:
+            self.__database.execute(
+                'ALTER TABLE session '
+                'ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        self.__database.execute(
+            'CREATE INDEX IF NOT EXISTS session_touched ON session (touched)')
+
+    def __probe(self, key):
+        """Get the time and version of the key's row and update the cache.
+
+        Cached data is dropped when another connection saved a different
+        version of it. None is returned in place of a row that is missing."""
+        row = self.__database.execute('''\
+SELECT touched,
+       version
+  FROM session
+ WHERE key = ?''', (key,)).fetchone()
+        if row is None:
+            self.__cache.pop(key, None)
+            return None
+        touched, version = row
+        cached = self.__cache.get(key)
+        if cached is not None:
+            if cached[1] == version:
+                self.__cache[key] = touched, version, cached[2]
+            else:
+                del self.__cache[key]
+        return row
+
+    def load(self, key):
+        """Get the data saved for the key if it has not expired yet.
+
+        Only the version of the row is checked while the cached copy of it
+        is current. Otherwise, the row is read again and cached for later."""
+        with self.__mutex:
+            if self.__probe(key) is None:
+                return None
+            if key not in self.__cache:
+                row = self.__database.execute('''\
+SELECT touched,
+       version,
+       data
+  FROM session
+ WHERE key = ?''', (key,)).fetchone()
+                if row is None:
+                    return None
+                self.__cache[key] = row
+            touched, version, data = self.__cache[key]
+        if time.time() - touched > self.__time_to_live:
+            return None
+        return data
+
+    def save(self, key, data):
+        """Store the data for the key and refresh its time to live.
+
+        The database is only written to when the data has changed or when
+        the time to live was last refreshed longer than an interval ago.
+        Every change to the data gives its row a new version number."""
+        now = time.time()
+        with self.__mutex:
+            self.__probe(key)
+            cached = self.__cache.get(key)
+            if cached is not None and cached[2] == data:
+                touched, version, _ = cached
+                if now - touched < self.__refresh_interval:
+                    return
+                if self.__database.execute(
+                        'UPDATE session SET touched = ? '
+                        'WHERE key = ? AND version = ?',
+                        (now, key, version)).rowcount:
+                    self.__cache[key] = now, version, data
+                    return
+            self.__database.execute('BEGIN IMMEDIATE')
+            try:
+                self.__database.execute('''\
+INSERT INTO session (
+  key,
+  touched,
+  version,
+  data
+) VALUES (?, ?, 1, ?)
+    ON CONFLICT (key)
+    DO UPDATE SET touched = excluded.touched,
+                  version = version + 1,
+                  data = excluded.data''', (key, now, data))
+                version, = self.__database.execute(
+                    'SELECT version FROM session WHERE key = ?',
+                    (key,)).fetchone()
+            except BaseException:
+                self.__database.execute('ROLLBACK')
+                raise
+            self.__database.execute('COMMIT')
+            self.__cache[key] = now, version, data
+
+    def delete(self, key):
+        """Remove any data that was saved for the key."""
+        with self.__mutex:
+            self.__database.execute(
+                'DELETE FROM session WHERE key = ?', (key,))
+            self.__cache.pop(key, None)
+
+    def purge(self):
+        """Delete all of the data that has outlived its time to live.
+
+        Only the expired keys are removed from the cache. A key refreshed by
+        another connection is read again the next time it is loaded."""
+        expired = time.time() - self.__time_to_live
+        with self.__mutex:
+            self.__database.execute(
+                'DELETE FROM session WHERE touched < ?', (expired,))
+            for key in [key for key, (touched, _, _) in self.__cache.items()
+                        if touched < expired]:
+                del self.__cache[key]
@@ -7,6 +7,9 @@ All user interactions are processed by the State class listed below."""
 
 import datetime
 import enum
+import itertools
+import marshal
+import threading
 
 # Public Names
 __all__ = (
@@ -39,15 +42,38 @@ class State:
     any arguments that they take. The VerseMatch servlet automatically
     creates State objects and adds them as attributes to Session objects."""
 
+    __slots__ = (
+        '__session',
+        '__library',
+        '__bib_svr',
+        '__mutex',
+        '__state',
+        '__quiz_id',
+        '__reference',
+        '__verses',
+        '__entries',
+        '__generation',
+        '__phrase',
+        '__found'
+    )
+
+    TIME_LIMIT = 15     # Seconds allowed for checking an answer.
+
     def __init__(self, session, library, bib_svr):
         """Initialize resources to be used by this instance."""
         self.__session = session
         self.__library = library
         self.__bib_svr = bib_svr
+        self.__mutex = threading.RLock()
         self.__state = Options.GET_QUIZ
         # These will be set again later on.
         self.__quiz_id = ''
-        self.__verses = []
+        self.__reference = None
+        self.__verses = ()
+        self.__entries = ()
+        self.__generation = 0
+        self.__phrase = ''
+        self.__found = None
 
     def load_quiz(self, quiz_id):
         """Transition from getting quiz to getting verse.
@@ -55,10 +81,23 @@ class State:
         The first screen of the verse quiz allows the client to select what
         category of verses he would liked to be quizzed from. This method
         verifies that selection and moves on to the next phase if possible."""
-        if self.__state is Options.GET_QUIZ:
-            if quiz_id in self.__library:
-                self.__state = Options.GET_VERSE
-                self.__quiz_id = quiz_id
+        with self.__mutex:
+            if self.__state is Options.GET_QUIZ:
+                if quiz_id in self.__library:
+                    self.__state = Options.GET_VERSE
+                    self.__quiz_id = quiz_id
+                    self.__generation += 1
+
+    def find_verses(self, phrase, limit):
+        """Search for verses with the phrase while getting the quiz.
+
+        Up to limit verses found by the Bible server are kept along with the
+        phrase so that they can be listed under the quiz selection. Searches
+        are not part of the dumped data, so the generation stays the same."""
+        with self.__mutex:
+            if self.__state is Options.GET_QUIZ:
+                self.__phrase = phrase
+                self.__found = self.__bib_svr.search(phrase, limit)
 
     def pick_verse(self, verse_id):
         """Move from picking the verse to teaching the verse.
@@ -67,25 +106,40 @@ class State:
         to choose what verse(s) should be used for a quiz. The selected
         reference is verified; and if the verse could be found, a state
         change occurs. Otherwise, the reference is removed from the list."""
-        if self.__state is Options.GET_VERSE:
-            file = self.__library[self.__quiz_id]
-            if verse_id in file:
-                bk, ch, v1, v2 = file[verse_id]
-                if bk is None:
-                    verses = None
-                elif v1 is None:
-                    verses = self.__bib_svr.fetch_chapter(bk, ch)
-                elif v1 == v2:
-                    verses = self.__bib_svr.fetch_verse(bk, ch, v1)
-                else:
-                    verses = self.__bib_svr.fetch_range(bk, ch, v1, v2)
-                if verses is None:
-                    del file[verse_id]
-                else:
-                    self.__verses = tuple(verses)
-                    for verse in self.__verses:
-                        verse.show_hint = False
-                    self.__state = Options.TEACH
+        with self.__mutex:
+            if self.__state is Options.GET_VERSE:
+                file = self.__library[self.__quiz_id]
+                if verse_id in file:
+                    reference = file[verse_id]
+                    verses = self.__fetch(reference)
+                    if verses is None:
+                        del file[verse_id]
+                    else:
+                        self.__reference = reference
+                        self.__verses = tuple(verses)
+                        self.__entries = ()
+                        for verse in self.__verses:
+                            verse.show_hint = False
+                        self.__state = Options.TEACH
+                        self.__generation += 1
+
+    def __fetch(self, reference):
+        """Get the verses that the reference refers to from the server.
+
+        Verses pinned by the library are used first. The server is only
+        asked for references that were not there when the library loaded."""
+        try:
+            return self.__library.verses(reference)
+        except KeyError:
+            pass
+        bk, ch, v1, v2 = reference
+        if bk is None:
+            return None
+        if v1 is None:
+            return self.__bib_svr.fetch_chapter(bk, ch)
+        if v1 == v2:
+            return self.__bib_svr.fetch_verse(bk, ch, v1)
+        return self.__bib_svr.fetch_range(bk, ch, v1, v2)
 
     def check_text(self, verses):
         """Begin checking the verses that were submitted.
@@ -93,12 +147,15 @@ class State:
         The text from the verse entry boxes is sent here for immediate
         grading. A verification engine is automatically started for
         each verse, and status messages are shown for boxes with content."""
-        if self.__state is Options.TEACH:
-            if self.__check_arg(verses):
-                for text, verse in zip(verses, self.__verses):
-                    verse.check(text, 15, self.__session.ip)
-                    verse.show_hint = bool(text)
-                self.__state = Options.CHECK
+        with self.__mutex:
+            if self.__state is Options.TEACH:
+                if self.__check_arg(verses):
+                    for text, verse in zip(verses, self.__verses):
+                        verse.check(text, self.TIME_LIMIT, self.__session.ip)
+                        verse.show_hint = bool(text)
+                    self.__entries = tuple(verses)
+                    self.__state = Options.CHECK
+                    self.__generation += 1
 
     def __check_arg(self, verses):
         """Verify that the argument given to check_text is valid."""
@@ -116,17 +173,19 @@ class State:
         have finished their checking procedure. If some are still
         being checked, the total that have finished is returned.
         Otherwise, the program goes back into its teaching mode."""
-        if self.__state is Options.CHECK:
-            checking = complete = 0
-            for verse in self.__verses:
-                status = verse.ready
-                if status is False:
-                    checking += 1
-                elif status is True:
-                    complete += 1
-            if checking == 0:
-                self.__state = Options.TEACH
-            return complete
+        with self.__mutex:
+            if self.__state is Options.CHECK:
+                checking = complete = 0
+                for verse in self.__verses:
+                    status = verse.ready
+                    if status is False:
+                        checking += 1
+                    elif status is True:
+                        complete += 1
+                if checking == 0:
+                    self.__state = Options.TEACH
+                    self.__generation += 1
+                return complete
 
     def go_back(self):
         """Go back to a previous state if possible.
@@ -135,8 +194,10 @@ class State:
         meeting certain requirements. Going backward is relatively
         easy with this method. Negative states are not allowed,
         and the verse-checking process may not be interrupted."""
-        if self.__state is not Options.CHECK:
-            self.__state = Options(max(1, self.__state - 1))
+        with self.__mutex:
+            if self.__state is not Options.CHECK:
+                self.__state = Options(max(1, self.__state - 1))
+                self.__generation += 1
 
     def reset_session(self):
         """Destroy this state and start over from scratch.
@@ -144,9 +205,86 @@ class State:
         In actuality, the session that keeps this state instance is
         removed from the session manager (if it exists there). Note
         that a new state is generated before a response is sent out."""
-        with self.__session.manager:
-            if self.__session.ip in self.__session.manager:
-                del self.__session.manager[self.__session.ip]
+        self.__session.manager.pop(self.__session.ip)
+
+    def dump(self):
+        """Serialize the compact parts of this state into bytes.
+
+        Only the current state, quiz id, verse reference, and the answers
+        with their results are kept. The verses themselves are fetched from
+        the Bible server again when the data is given to the restore method."""
+        with self.__mutex:
+            verses = tuple(
+                (verse.show_hint, entry,
+                 verse.value if entry is not None and verse.ready is True
+                 else None)
+                for verse, entry in itertools.zip_longest(
+                    self.__verses, self.__entries)
+            )
+            return marshal.dumps((int(self.__state), self.__quiz_id,
+                                  self.__reference, verses))
+
+    def restore(self, data):
+        """Replace this state with one serialized by the dump method.
+
+        Data that is None puts the state back to where it started. Verse
+        checks that were still running when the data was dumped are started
+        again here since their results could not be included with the data,
+        unless this process is already checking the same entry for them."""
+        with self.__mutex:
+            self.__generation += 1
+            checked = {}
+            if self.__entries:
+                checked = {
+                    (self.__reference, index, entry): verse
+                    for index, (verse, entry) in enumerate(
+                        zip(self.__verses, self.__entries))
+                    if verse.ready is not None
+                }
+            if data is None:
+                state, quiz_id, reference, verses = \
+                    Options.GET_QUIZ, '', None, ()
+            else:
+                state, quiz_id, reference, verses = marshal.loads(data)
+            self.__state = Options(state)
+            self.__quiz_id = quiz_id
+            self.__reference = reference
+            self.__verses = () if reference is None else tuple(
+                self.__fetch(reference) or ())
+            self.__entries = ()
+            if len(self.__verses) != len(verses):
+                self.__verses = ()
+                if self.__state > Options.GET_VERSE:
+                    self.__state = Options.GET_VERSE
+                return
+            self.__verses = tuple(
+                checked.get((reference, index, entry), verse)
+                for index, (verse, (_, entry, _)) in enumerate(
+                    zip(self.__verses, verses))
+            )
+            for verse, (show_hint, entry, value) in zip(self.__verses, verses):
+                verse.show_hint = show_hint
+                if value is not None:
+                    verse.restore(value)
+                elif entry is not None and verse.ready is None:
+                    verse.check(entry, self.TIME_LIMIT, self.__session.ip)
+            if verses and verses[0][1] is not None:
+                self.__entries = tuple(entry for _, entry, _ in verses)
+
+    @property
+    def generation(self):
+        """Read-only count of the changes that could alter a dump."""
+        return self.__generation
+
+    @property
+    def phrase(self):
+        """Read-only phrase property for VerseMatch class."""
+        return self.__phrase
+
+    @property
+    def found(self):
+        """Read-only found-verses property for VerseMatch class."""
+        return self.__found
 
     @property
     def current(self):
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Trace where the time goes while requests are being handled.
+
+Functions marked as traced record spans in the trace event format used by
+Chrome, so a trace file can be opened in chrome://tracing or in Perfetto.
+Only a sample of the requests is traced, and nothing is recorded at all
+until tracing is started, so marked functions cost very little otherwise."""
+
+import atexit
+import datetime
+import functools
+import json
+import os
+import pathlib
+import random
+import threading
+import time
+
+# Public Names
+__all__ = (
+    'start',
+    'stop',
+    'traced',
+    'record'
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+
+def start(path, sample=1.0, buffer_size=1024):
+    """Start tracing a sample of the requests into files named after path.
+
+    Every process writes a file of its own, with its process ID put before
+    the suffix of path, so trace.json becomes trace.1234.json for example.
+    Events are buffered and appended to the file buffer_size at a time.
+    Anything still buffered is written when tracing is stopped or when the
+    program exits."""
+    global _tracer
+    stop()
+    _tracer = _Tracer(path, sample, buffer_size)
+
+
+def stop():
+    """Stop tracing and write out the events that were buffered."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.flush()
+
+
+def traced(name, root=False):
+    """Make a decorator that records a span for each call of a function.
+
+    A root function decides if the request it handles is in the sample, and
+    the other functions are only traced while called from a sampled one."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return function(*args, **kwargs)
+            sampled = getattr(_local, 'sampled', False)
+            if root:
+                _local.sampled = tracer.sample()
+            elif not sampled:
+                return function(*args, **kwargs)
+            begin = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if not root or _local.sampled:
+                    tracer.add(name, begin, time.perf_counter() - begin, {})
+                _local.sampled = sampled
+        return wrapper
+    return decorate
+
+
+def record(name, begin, duration, **args):
+    """Record a span that was timed by the caller if tracing this thread.
+
+    The span starts at begin, as given by time.perf_counter, and lasts for
+    duration seconds. Any keyword arguments are shown along with the span."""
+    tracer = _tracer
+    if tracer is not None and getattr(_local, 'sampled', False):
+        tracer.add(name, begin, duration, args)
+
+
+class _Tracer:
+    """Collect the events of a trace and append them to its file."""
+
+    def __init__(self, path, sample, buffer_size):
+        """Initialize the tracer and make sure its events will be saved."""
+        self.__path = pathlib.Path(path)
+        self.__sample = sample
+        self.__buffer_size = buffer_size
+        self.__mutex = threading.Lock()
+        self.__writing = threading.Lock()
+        self.__events = []
+        atexit.register(self.flush)
+
+    def sample(self):
+        """Decide if the request that is starting should be traced."""
+        return self.__sample >= 1 or random.random() < self.__sample
+
+    def add(self, name, begin, duration, args):
+        """Buffer a complete event and write the buffer once it is full."""
+        event = dict(name=name, ph='X', pid=os.getpid(),
+                     tid=threading.get_ident(), ts=begin * 1e6,
+                     dur=duration * 1e6)
+        if args:
+            event['args'] = args
+        with self.__mutex:
+            self.__events.append(event)
+            full = len(self.__events) >= self.__buffer_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered events to the file as a JSON array.
+
+        The closing bracket of the array is left off, which the trace event
+        format allows, so that more events can always be appended later.
+        The file belongs to the current process, so only it starts the array
+        with an opening bracket."""
+        with self.__mutex:
+            events, self.__events = self.__events, []
+        if not events:
+            return
+        text = ''.join(json.dumps(event, separators=(',', ':')) + ',\n'
+                       for event in events)
+        with self.__writing:
+            path = self.__path.with_suffix(
+                f'.{os.getpid()}{self.__path.suffix}')
+            with path.open('a') as file:
+                if not file.tell():
+                    text = '[\n' + text
+                file.write(text)
+
+
+_local = threading.local()
+_tracer = None
@@ -5,24 +5,38 @@
 This program is a port of the VerseMatch program written
 in CPS 110 at BJU during the Autumn Semester of 2003."""
 
+import atexit
 import datetime
+import email.utils
+import gzip
+import hashlib
 import mimetypes
-import os
 import pathlib
 import sys
+import threading
+import time
+from html import escape
 
+import access_log
 import bible_verse
 import database
 import html_source
 import library
 import manager
 import servlet
+import session_snapshot
+import session_store
+import tracing
+import wsgi_adapter
 from state import State, Options
 
 # Public Names
 __all__ = (
     'main',
+    'wsgi',
     'indent',
+    'ClientSession',
+    'PageCache',
     'FileHandler',
     'VerseMatch'
 )
@@ -33,16 +47,56 @@ __date__ = datetime.date(2020, 6, 30)
 __author__ = 'Stephen Paul Chappell'
 __credits__ = 'Summer Computer Science Camp'
 
+# Symbolic Constants
+ROOT = pathlib.Path(__file__).parent    # Directory holding the program.
 
-def main():
-    """Initialize program variables and start the server."""
-    # Initialize verse database and library.
-    os.chdir(pathlib.Path(sys.argv[0]).parent)
-    VerseMatch.init(
-        pathlib.Path('quizzes'), pathlib.Path('database') / 'pg30.db')
-    # Start servlet with debugging enabled.
+
+def main(workers=1, pool_size=0):
+    """Initialize program variables and start the server.
+
+    Giving more than one worker pre-forks that many server processes.
+    They keep their sessions in a shared database so that every process
+    sees the same state for a client, no matter which one answers it.
+    A single process saves snapshots of its sessions to use on restart.
+    A positive pool size serves each process with that many threads in
+    an HttpPoolServer instead of starting a thread for every connection."""
+    # Start servlet with debugging enabled and requests logged in the
+    # background.
     servlet.HttpServlet.debug(True)
-    servlet.HttpServer.main(VerseMatch, 8080)
+    servlet.HttpServlet.access_log = access_log.AccessLog()
+    server_class = servlet.HttpServer
+    if pool_size > 0:
+        server_class = servlet.HttpPoolServer
+        server_class.configure(dict(pool_size=pool_size))
+    server_class.main(VerseMatch, 8080, workers, VerseMatch.init,
+                      _init_args(workers))
+
+
+def wsgi(workers=1):
+    """Initialize program variables and get a WSGI application to serve.
+
+    The number of workers is how many processes the WSGI server runs the
+    application in, and it decides how sessions are kept just as in main.
+    Each process that the server starts must call this function itself."""
+    VerseMatch.init(*_init_args(workers))
+    return wsgi_adapter.Application(VerseMatch)
+
+
+def _init_args(workers):
+    """Find the paths for init in the directory holding this module.
+
+    The paths do not depend on the working directory or on sys.argv, which
+    names the WSGI server's own program when the application is embedded."""
+    # Initialize verse database and library in each server process.
+    database_path = ROOT / 'database'
+    bible_path = database_path / 'pg30.bin'
+    if not bible_path.is_file():
+        bible_path = database_path / 'pg30.db'
+    if workers > 1:
+        session_path, snapshot_path = database_path / 'sessions.db', None
+    else:
+        session_path, snapshot_path = None, database_path / 'sessions.snap'
+    return ROOT / 'quizzes', bible_path, session_path, snapshot_path
 
 
 def indent(text, level):
@@ -50,28 +104,172 @@ def indent(text, level):
     return '\n'.join(' ' * level + line for line in text.splitlines())
 
 
+class ClientSession(manager.Session):
+    """Hold the variables of a client's session with VerseMatch.
+
+    Besides the state of the client's application instance, the session
+    keeps the client's IP address and the data last shared for the state.
+    Data taken from a snapshot is pending until it is restored under the
+    mutex, and the generation tells which version of the state was saved."""
+
+    __slots__ = (
+        'state',
+        'ip',
+        'data',
+        'pending',
+        'mutex',
+        'generation'
+    )
+
+
+class PageCache:
+    """Keep rendered pages and fragments that many clients have in common.
+
+    Each value is stored under a key together with a stamp that tells what
+    it was rendered from. A value is rendered again when its stamp changes,
+    and everything is forgotten when the templates are reloaded or when
+    more than limit values have been stored since the cache was cleared."""
+
+    def __init__(self, limit):
+        """Initialize an empty cache that holds up to limit values."""
+        self.__limit = limit
+        self.__values = {}
+        self.__generation = None
+
+    def get(self, key, stamp, render):
+        """Get the value stored for the key, rendering it if needed.
+
+        The render function is called without arguments when the key is
+        missing or its stamp does not match, and its result is stored."""
+        generation = html_source.generation()
+        if generation != self.__generation:
+            self.__values = {}
+            self.__generation = generation
+        entry = self.__values.get(key)
+        if entry is None or entry[0] != stamp:
+            if len(self.__values) >= self.__limit:
+                self.__values = {}
+            entry = self.__values[key] = stamp, render()
+        return entry[1]
+
+
 class FileHandler(servlet.HttpServlet):
     """Try to serve file requests from the static path directory.
 
     The FileHandler class is meant as a patch to HttpServlet to allow
-    automatic handling of file requests that the handler might received."""
+    automatic handling of file requests that the handler might received.
+    The files are read into memory once and are sent with validators, so
+    browsers that already have a file are told that it was not modified."""
 
     block_favicon_request = False
-    static_path = pathlib.Path(sys.argv[0]).parent / 'include'
+    static_path = ROOT / 'include'
+    static_max_age = 60 * 60 * 24   # Seconds browsers may reuse the files.
+    static_files = None             # Maps request paths to loaded files.
+    static_gzip_ratio = 0.8         # Largest compressed size that is kept.
+
+    @classmethod
+    def load_static_files(cls):
+        """Read every file under the static path into memory.
+
+        Only the files found here can be served afterwards, so a request
+        path can never lead to a file outside of the static directory.
+        A compressed copy of each file is made as well, and it is kept when
+        it is small enough to be worth sending. The total size of the files
+        is returned along with the size they have when sent compressed."""
+        cls.static_files = {
+            '/' + path.relative_to(cls.static_path).as_posix():
+                _StaticFile(path, cls.static_gzip_ratio)
+            for path in cls.static_path.rglob('*') if path.is_file()
+        }
+        return (sum(len(file.body) for file in cls.static_files.values()),
+                sum(len(file.gzip_body or file.body)
+                    for file in cls.static_files.values()))
 
     def service(self, request, response):
         """Check and handle any valid file requests from the client."""
-        path = request.path[1:]
-        if path and not (request.params or request.query or request.fragment):
-            path = self.static_path / path
-            if path.is_file():
-                kind, encoding = mimetypes.guess_type(str(path))
-                response.setContentType(kind or 'application/octet-stream')
-                response.setBinaryPayload(path.open('rb'))
+        if request.path[1:] and not (request.params or request.query or
+                                     request.fragment):
+            if self.static_files is None:
+                self.load_static_files()
+            file = self.static_files.get(request.path)
+            if file is not None:
+                body, etag = file.body, file.etag
+                if file.gzip_body is None:
+                    response.setCompressible(False)
+                else:
+                    response.setHeader('Vary', 'Accept-Encoding')
+                    if request.accepts_encoding('gzip'):
+                        body, etag = file.gzip_body, file.gzip_etag
+                        response.setHeader('Content-Encoding', 'gzip')
+                response.setContentType(file.kind)
+                response.setHeader('ETag', etag)
+                response.setHeader('Last-Modified', file.last_modified)
+                response.setHeader('Cache-Control',
+                                   f'public, max-age={self.static_max_age}')
+                if file.not_modified(etag,
+                                     request.getHeader('If-None-Match'),
+                                     request.getHeader('If-Modified-Since')):
+                    response.setStatus(304)
+                else:
+                    response.setBinaryPayload(body)
                 return True
         return False
 
 
+class _StaticFile:
+    """Hold the contents of a static file along with its validators.
+
+    The entity tag is made from a hash of the contents, so it stays the
+    same in every server process and after restarts if nothing changed.
+    The compressed copy of the file has its own tag since it is different.
+    Files that compress poorly have no copy and are always sent as they are."""
+
+    __slots__ = (
+        'body',
+        'gzip_body',
+        'kind',
+        'etag',
+        'gzip_etag',
+        'modified',
+        'last_modified'
+    )
+
+    def __init__(self, path, gzip_ratio):
+        """Initialize the file by reading and compressing it from the path."""
+        self.body = path.read_bytes()
+        self.gzip_body = gzip.compress(self.body, 9, mtime=0)
+        if len(self.gzip_body) > gzip_ratio * len(self.body):
+            self.gzip_body = None
+        kind, encoding = mimetypes.guess_type(str(path))
+        self.kind = kind or 'application/octet-stream'
+        digest = hashlib.blake2b(self.body, digest_size=8).hexdigest()
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.modified = int(path.stat().st_mtime)
+        self.last_modified = email.utils.formatdate(self.modified,
+                                                    usegmt=True)
+
+    def not_modified(self, etag, if_none_match, if_modified_since):
+        """Decide if the client's copy of the file is still current.
+
+        The entity tags are compared with the tag of the copy being sent
+        when the client sent any. Otherwise, the modification time is,
+        and a date without a time zone is taken to be in UTC."""
+        if if_none_match is not None:
+            tags = {tag.strip() for tag in if_none_match.split(',')}
+            return bool(tags & {'*', etag, 'W/' + etag})
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                # A -0000 zone leaves the date naive, but it is still UTC.
+                since = since.replace(tzinfo=datetime.timezone.utc)
+            return self.modified <= since.timestamp()
+        return False
+
+
 class VerseMatch(FileHandler):
     """Create a handler responsible for the application.
 
@@ -80,21 +278,70 @@ class VerseMatch(FileHandler):
 
     __status = None     # Create a default value.
     __init = False      # Tracks if VerseMatch was initialized.
+    SESSION_SNAPSHOT = None
+    SETTINGS = FileHandler.SETTINGS + ('BIBLE_BACKEND', 'DATABASE_POOL')
+
+    SEARCH_LIMIT = 20               # Verses shown for a phrase search.
+    PAGE_CACHE_LIMIT = 1024         # Pages and fragments that are cached.
+    BIBLE_BACKEND = 'server'        # Either 'server' or 'buffer' for .db.
+    DATABASE_POOL = 4               # Connections used by a 'server'.
+
+    SESSION_TTL = 60 * 60 * 24      # Sessions may live for up to 24 hours.
+
+    TRACE_PATH = None               # Names the trace file of each process.
+    TRACE_SAMPLE = 0.01             # Share of the requests that are traced.
 
     @classmethod
-    def init(cls, lib_path, db_path):
+    def init(cls, lib_path, db_path, session_path=None, snapshot_path=None):
         """Initialize static variables so this class can be used.
 
         The session manager cleans memory of old sessions not in use.
-        The library keeps Bible references and generates related HTML.
-        The Bible server responds to verse queries with Verse objects."""
+        The Bible server responds to verse queries with Verse objects.
+        It maps the database into memory when given a pg30.bin file.
+        Otherwise, BIBLE_BACKEND picks between querying the database with
+        a connection pool ('server') and loading all of it ('buffer').
+        The library keeps Bible references and generates related HTML,
+        and it pins the text of every referenced verse for quick picks.
+        If a session path is given, the session data is shared with any
+        other server processes that were started with the same path.
+        Otherwise, a snapshot path allows sessions to survive restarts."""
         assert not cls.__init, 'VerseMatch is already initialized!'
-        # Session Manager closes old sessions each hour.
-        cls.SESSION_MANAGER = manager.SessionManager(3600)
+        # Session Manager closes old sessions each minute.
+        if session_path is None:
+            cls.SESSION_MANAGER = manager.SessionManager(60)
+        else:
+            store = session_store.SessionStore(session_path, cls.SESSION_TTL)
+            cls.SESSION_MANAGER = manager.SharedSessionManager(60, store)
         cls.SESSION_MANAGER.daemon = True
         cls.SESSION_MANAGER.start()
-        cls.LIBRARY = library.VerseLibrary(lib_path)
-        cls.BIBLE_SERVER = database.BibleServer(db_path)
+        # Session Snapshot saves changed sessions every half minute.
+        if session_path is None and snapshot_path is not None:
+            cls.SESSION_SNAPSHOT = session_snapshot.SessionSnapshot(
+                snapshot_path, 30, cls.SESSION_TTL)
+            cls.SESSION_SNAPSHOT.daemon = True
+            cls.SESSION_SNAPSHOT.start()
+            atexit.register(cls.SESSION_SNAPSHOT.write)
+        if db_path.suffix == '.bin':
+            cls.BIBLE_SERVER = database.BibleMap(db_path)
+        elif cls.BIBLE_BACKEND == 'server':
+            cls.BIBLE_SERVER = database.BibleServer(
+                db_path, pool_size=cls.DATABASE_POOL)
+        elif cls.BIBLE_BACKEND == 'buffer':
+            cls.BIBLE_SERVER = database.BibleBuffer(db_path)
+        else:
+            raise ValueError(f'unknown Bible backend {cls.BIBLE_BACKEND!r}')
+        cls.LIBRARY = library.VerseLibrary(lib_path, cls.BIBLE_SERVER)
+        size, sent = cls.load_static_files()
+        if size:
+            print(f'Static files are sent at {sent / size:.0%} of their size')
+        # Page Cache keeps what is rendered the same for many clients.
+        cls.PAGE_CACHE = PageCache(cls.PAGE_CACHE_LIMIT)
+        # Templates are compiled now and reloaded soon after they change.
+        html_source.reload()
+        html_source.watch(2)
+        # Tracing shows where the time goes in a sample of the requests.
+        if cls.TRACE_PATH is not None:
+            tracing.start(cls.TRACE_PATH, cls.TRACE_SAMPLE)
         cls.__init = True
         # "verse.Verse.init_manager" should be called
         # somewhere to ensure that verse checks are killed.
@@ -109,10 +356,19 @@ class VerseMatch(FileHandler):
             # Handle action desired by the client.
             action = request.getParameter('action')
             state = self.exe_action(action, state, request)
+            self.save_state(state)
             # Render HTML specified by current state.
             response.setContentType('text/html')
-            response.getWriter().print(self.render_html(state))
-
+            start = time.perf_counter()
+            page, encoding = self.render_page(
+                state, 'gzip' if request.accepts_encoding('gzip') else None)
+            if encoding is not None:
+                response.setHeader('Content-Encoding', encoding)
+                response.setHeader('Vary', 'Accept-Encoding')
+            response.setBinaryPayload(page)
+            response.setTiming('render', time.perf_counter() - start)
+
+    @tracing.traced('VerseMatch.get_state')
     def get_state(self):
         """Get state of client's specific application instance.
 
@@ -120,19 +376,66 @@ class VerseMatch(FileHandler):
         If there is a session associated with the client, the
         session's state is returned for further processing.
         Otherwise, a new session is created with a new state
-        object being added to it, and the new state is returned."""
+        object being added to it, and the new state is returned.
+        Shared sessions are brought up to date with the data that
+        any of the other server processes may have saved for them."""
         ip = self.client_address[0]
-        with self.SESSION_MANAGER:
-            if ip in self.SESSION_MANAGER:
-                session = self.SESSION_MANAGER[ip]
-            else:
-                # Sessions may live for up to 24 hours.
-                session = manager.Session(60 * 60 * 24)
-                session.state = State(session, self.LIBRARY, self.BIBLE_SERVER)
-                session.ip = ip
-                self.SESSION_MANAGER[ip] = session
+        session = self.SESSION_MANAGER.obtain(ip, self.__create_session, ip)
+        if session.pending is not None:
+            # A session from before a restart is brought back to life.
+            with session.mutex:
+                if session.pending is not None:
+                    session.state.restore(session.pending)
+                    session.generation = session.state.generation
+                    session.pending = None
+        if isinstance(self.SESSION_MANAGER, manager.SharedSessionManager):
+            with session.mutex:
+                data = self.SESSION_MANAGER.load(ip)
+                if data != session.data:
+                    session.state.restore(data)
+                    session.data = data
         return session.state
 
+    def __create_session(self, ip):
+        """Create a new session with a new state for the IP address.
+
+        This is called while the session manager holds a lock, so data from
+        a snapshot is only taken here and restored later by get_state. The
+        mutex of the session guards its data while it is being restored."""
+        session = ClientSession(self.SESSION_TTL)
+        session.state = State(session, self.LIBRARY, self.BIBLE_SERVER)
+        session.ip = ip
+        session.data = session.pending = session.generation = None
+        session.mutex = threading.Lock()
+        if self.SESSION_SNAPSHOT is not None:
+            session.pending = self.SESSION_SNAPSHOT.take(ip)
+        return session
+
+    def save_state(self, state):
+        """Save the state of a session for other processes or restarts.
+
+        Shared sessions are saved for the other server processes, which
+        also keeps them alive in the database. Otherwise, the state may be
+        recorded for the next snapshot if it changed since it was last
+        recorded. If neither is in use, nothing is saved for the session."""
+        ip = self.client_address[0]
+        if isinstance(self.SESSION_MANAGER, manager.SharedSessionManager):
+            session = self.SESSION_MANAGER.get(ip)
+            if session is None:
+                self.SESSION_MANAGER.save(ip, state.dump())
+                return
+            with session.mutex:
+                data = state.dump()
+                self.SESSION_MANAGER.save(ip, data)
+                session.data = data
+        elif self.SESSION_SNAPSHOT is not None:
+            session = self.SESSION_MANAGER.get(ip)
+            if session is not None and session.state is state and \
+                    session.generation != state.generation:
+                session.generation = state.generation
+                self.SESSION_SNAPSHOT.record(ip, state.dump())
+
+    @tracing.traced('VerseMatch.exe_action')
     def exe_action(self, action, state, request):
         """Execute the action specified by the caller.
 
@@ -158,8 +461,48 @@ class VerseMatch(FileHandler):
             self.__status = 0
         elif action == 'check_status':
             self.__status = state.check_status()
+        elif action == 'Find Verse':
+            # Form field for the search should be called "phrase."
+            state.find_verses(request.getParameter('phrase') or '',
+                              self.SEARCH_LIMIT)
         return state
 
+    def render_page(self, state, encoding=None):
+        """Render the current state into the bytes sent to the client.
+
+        Pages that look the same for every client in the same state are
+        taken from the page cache. That is the quiz page when no search was
+        made, the verse menu of each quiz, and verses that show no hints.
+        When the encoding is gzip, a cached page that is large enough is
+        compressed once and its compressed copy is cached next to it. The
+        page is returned with the encoding applied to it, if there was one."""
+        key = stamp = None
+        if state.current is Options.GET_QUIZ:
+            if state.found is None:
+                key = 'GET_QUIZ',
+        elif state.current is Options.GET_VERSE:
+            file = state.verse_file
+            key, stamp = ('GET_VERSE', file), file.generation
+        elif state.current is Options.TEACH:
+            verses = state.verse_list
+            if not any(verse_obj.show_hint for verse_obj in verses):
+                key = 'TEACH', tuple(verse_obj.addr for verse_obj in verses)
+        if key is None:
+            return self.encode(self.render_html(state)), None
+        page = self.PAGE_CACHE.get(
+            key, stamp, lambda: self.encode(self.render_html(state)))
+        if encoding == 'gzip' and len(page) >= self.compress_minimum:
+            return self.PAGE_CACHE.get(
+                (encoding, key), stamp, lambda: self.compress(page)), encoding
+        return page, None
+
+    @staticmethod
+    def encode(text):
+        """Encode the text with each line ending in a carriage return."""
+        lines = text.replace('\r\n', '\n').replace('\r', '\n')
+        return lines.replace('\n', '\r\n').encode()
+
+    @tracing.traced('VerseMatch.render_html')
     def render_html(self, state):
         """Render the XHTML of the current state.
 
@@ -169,23 +512,30 @@ class VerseMatch(FileHandler):
         rendered here along with XHTML code that may
         need to be dynamically generated on the fly."""
         if state.current is Options.GET_QUIZ:
-            select = indent(self.LIBRARY.html('quiz', 'Options:'), 16)
-            get_quiz = html_source.GET_QUIZ.format(select)
-            template = html_source.TEMPLATE.format('', get_quiz)
+            select = self.PAGE_CACHE.get('select', None, lambda: indent(
+                self.LIBRARY.html('quiz', 'Options:'), 16))
+            search = html_source.SEARCH.render(escape(state.phrase),
+                                               self.render_found(state))
+            get_quiz = html_source.GET_QUIZ.render(select)
+            template = html_source.TEMPLATE.render('', get_quiz, search)
         elif state.current is Options.GET_VERSE:
-            title, menu = self.render_menu(state)
-            get_verse = html_source.GET_VERSE.format(title, menu)
-            template = html_source.TEMPLATE.format('', get_verse)
+            file = state.verse_file
+            title, menu = self.PAGE_CACHE.get(
+                ('menu', file), file.generation,
+                lambda: self.render_menu(state))
+            get_verse = html_source.GET_VERSE.render(title, menu)
+            template = html_source.TEMPLATE.render('', get_verse, '')
         elif state.current is Options.TEACH:
             area = self.render_area(state)
-            teach = html_source.TEACH.format(area)
-            template = html_source.TEMPLATE.format('', teach)
+            teach = html_source.TEACH.render(area)
+            template = html_source.TEMPLATE.render('', teach, '')
         elif state.current is Options.CHECK:
-            check = html_source.CHECK.format(
+            check = html_source.CHECK.render(
                 (self.__status if self.__status else 'No'),
                 (' has' if self.__status == 1 else 's have')
             )
-            template = html_source.TEMPLATE.format(html_source.REFRESH, check)
+            template = html_source.TEMPLATE.render(
+                html_source.REFRESH, check, '')
         else:
             raise ValueError(f'{state.current!r} is not a valid state')
         return template
@@ -205,6 +555,27 @@ class VerseMatch(FileHandler):
         ul.append('</ul>')
         return file.title, indent('\n'.join(ul), 16)
 
+    @staticmethod
+    def render_found(state):
+        """Create a list of the verses found by a search.
+
+        The first page of the application (GET_QUIZ) also
+        lets quiz authors and campers search for a phrase.
+        Any verses that were found are listed for them, but
+        nothing is added if a search has not been made yet."""
+        if state.found is None:
+            return ''
+        if not state.found:
+            return '''
+                <h4 class="hug">No verses have that phrase in them.</h4>'''
+        ul = ['<ul class="hug">']
+        li = '<li>\n    <b>{}</b> {}\n</li>'
+        ul.extend(indent(li.format(escape(verse_obj.addr),
+                                   escape(verse_obj.text)), 4)
+                  for verse_obj in state.found)
+        ul.append('</ul>')
+        return '\n' + indent('\n'.join(ul), 16)
+
     def render_area(self, state):
         """Create code for verse entry boxes.
 
@@ -212,7 +583,7 @@ class VerseMatch(FileHandler):
         requires textarea XHTML code for individual verses
         to be entered in. The relevant fieldset, legend, and
         status codes are added to the template and returned."""
-        return '\n'.join(html_source.VERSE.format(
+        return '\n'.join(html_source.VERSE.render(
             verse_obj.addr,
             f'verse{index}',
             *self.render_status(verse_obj)
@@ -248,4 +619,4 @@ class VerseMatch(FileHandler):
 
 
 if __name__ == '__main__':
-    main()
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,213 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Adapt HttpServlet subclasses to run as WSGI applications.
+
+A servlet written for the servlet module can be served by any WSGI server
+without its service method being changed. Request and response objects are
+built from each environ just as HttpServlet builds them from a socket, and
+the response is given back to the WSGI server as an iterable body."""
+
+import cgitb
+import datetime
+import email.message
+import io
+import socketserver
+import sys
+import urllib.parse
+import wsgiref.simple_server
+
+import servlet
+
+# Public Names
+__all__ = (
+    'Application',
+    'serve'
+)
+
+# Module Documentation
+__version__ = 1, 0, 0
+__date__ = datetime.date(2026, 10, 19)
+__author__ = 'Stephen Paul Chappell'
+__credits__ = 'Summer Computer Science Camp'
+
+
+class Application:
+    """Call the service method of an HttpServlet subclass for WSGI.
+
+    A servlet instance is made for each request without a socket, so its
+    service method can still look at attributes like client_address. Only
+    GET and POST are handled, and the rules that HttpServlet has for them
+    apply here too. Binary payloads that are files are handed to the WSGI
+    server's file wrapper so that it can send them in the fastest way."""
+
+    __NO_BODY = frozenset({204, 304})   # Status codes sent without a body.
+
+    def __init__(self, servlet_class):
+        """Initialize the application with the servlet class to run."""
+        self.__servlet_class = servlet_class
+
+    def __call__(self, environ, start_response):
+        """Service the request in the environ and return the response body."""
+        handler = self.__handler(environ)
+        if handler.command == 'GET':
+            if handler.block_favicon_request and \
+                    handler.path == '/favicon.ico':
+                return self.__error(handler, start_response, 404)
+            query, form = handler.path, None
+        elif handler.command == 'POST':
+            try:
+                length = int(environ['CONTENT_LENGTH'])
+                if length < 0:
+                    raise ValueError(length)
+            except (KeyError, ValueError):
+                return self.__error(handler, start_response, 411)
+            if length > handler.max_body_size:
+                return self.__error(handler, start_response, 413)
+            query, form = '', handler.read_form(
+                environ['wsgi.input'], length, handler.read_size)
+            if form is None:
+                return self.__error(handler, start_response, 400,
+                                    'Request body ended early')
+        else:
+            return self.__error(handler, start_response, 501)
+        # noinspection PyProtectedMember
+        request = servlet._HttpServletRequest(query, handler.headers, form)
+        # noinspection PyProtectedMember
+        response = servlet._HttpServletResponse()
+        # noinspection PyBroadException
+        try:
+            handler.service(request, response)
+        except Exception:
+            if not handler.debug():
+                raise   # The WSGI server logs the error and answers 500.
+            klass, value, trace = sys.exc_info()
+            page = cgitb.html((klass, value, trace.tb_next)).encode()
+            start_response('500 Internal Server Error', [
+                ('Content-Type', 'text/html'),
+                ('Content-Length', str(len(page)))
+            ], sys.exc_info())
+            return [page]
+        return self.__respond(handler, request, response, environ,
+                              start_response)
+
+    def __handler(self, environ):
+        """Make a servlet instance describing the request in the environ.
+
+        The path is quoted again since the WSGI server has already decoded
+        it, and it is taken from below where the application is mounted.
+        The headers are rebuilt from the CGI-style keys in the environ."""
+        handler = self.__servlet_class.__new__(self.__servlet_class)
+        handler.command = environ['REQUEST_METHOD']
+        handler.request_version = environ.get('SERVER_PROTOCOL', 'HTTP/1.0')
+        handler.client_address = (environ.get('REMOTE_ADDR', ''),
+                                  int(environ.get('REMOTE_PORT') or 0))
+        handler.path = urllib.parse.quote(
+            environ.get('PATH_INFO', '').encode('latin-1')) or '/'
+        if environ.get('QUERY_STRING'):
+            handler.path += '?' + environ['QUERY_STRING']
+        handler.headers = email.message.Message()
+        for key, value in environ.items():
+            if key.startswith('HTTP_'):
+                name = key[5:]
+            elif key in {'CONTENT_TYPE', 'CONTENT_LENGTH'}:
+                name = key
+            else:
+                continue
+            if value:
+                handler.headers[name.replace('_', '-').title()] = value
+        return handler
+
+    # noinspection PyProtectedMember
+    def __respond(self, handler, request, response, environ, start_response):
+        """Start the response and return its body as an iterable.
+
+        A body held in memory is compressed the same way HttpServlet would
+        compress it. A file payload is passed to wsgi.file_wrapper if there
+        is one and nothing was printed before it, and otherwise it is read
+        in pieces. The payload's file is closed by the WSGI server."""
+        headers = response._headers
+        header_list = list(headers.items())
+        status = self.__status(handler, response._status)
+        if response._status in self.__NO_BODY:
+            start_response(status, header_list)
+            return []
+        body = bytes(response._value)
+        payload = response._binary_payload
+        if payload is not None and not hasattr(payload, 'read'):
+            body, payload = b''.join((body, payload)), None
+        if payload is None and 'Content-Encoding' not in headers and \
+                response._compressible and \
+                handler.compressible(response._type):
+            if 'Vary' not in headers:
+                header_list.append(('Vary', 'Accept-Encoding'))
+            if len(body) >= handler.compress_minimum and \
+                    request.accepts_encoding('gzip'):
+                body = handler.compress(body)
+                header_list.append(('Content-Encoding', 'gzip'))
+        header_list.append(('Content-Type', response._type))
+        if payload is None:
+            header_list.append(('Content-Length', str(len(body))))
+            start_response(status, header_list)
+            return [body]
+        cur = payload.tell()
+        end = payload.seek(0, io.SEEK_END)
+        payload.seek(cur, io.SEEK_SET)
+        header_list.append(('Content-Length', str(len(body) + end - cur)))
+        start_response(status, header_list)
+        if not body and 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](payload, handler.read_size)
+        return self.__stream(body, payload, handler.read_size)
+
+    @staticmethod
+    def __stream(body, payload, read_size):
+        """Generate the printed body followed by pieces of the payload."""
+        try:
+            if body:
+                yield body
+            yield from iter(lambda: payload.read(read_size), b'')
+        finally:
+            payload.close()
+
+    @staticmethod
+    def __status(handler, code, message=None):
+        """Get the status line of the code for start_response."""
+        if message is None:
+            message = handler.responses.get(code, ('',))[0]
+        return f'{code} {message}'.rstrip()
+
+    def __error(self, handler, start_response, code, message=None):
+        """Start an error response with the servlet's error page."""
+        short, long = handler.responses.get(code, ('???', '???'))
+        page = (handler.error_message_format % dict(
+            code=code,
+            message=message or short,
+            explain=long
+        )).encode('utf-8', 'replace')
+        start_response(self.__status(handler, code, message), [
+            ('Content-Type', handler.error_content_type),
+            ('Content-Length', str(len(page)))
+        ])
+        return [page]
+
+
+class _WSGIServer(socketserver.ThreadingMixIn,
+                  wsgiref.simple_server.WSGIServer):
+    """Handle each client of the WSGI server on its own thread."""
+
+    daemon_threads = True
+
+
+def serve(servlet_class, port=8080, initializer=None, initargs=()):
+    """Run the servlet class as a WSGI application on wsgiref's server.
+
+    This is meant for trying out the adapter before using another WSGI
+    server. The initializer is called with initargs before serving starts."""
+    if initializer is not None:
+        initializer(*initargs)
+    with wsgiref.simple_server.make_server(
+            '', port, Application(servlet_class), _WSGIServer) as server:
+        print('Serving WSGI on port', port, '...')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print('Keyboard interrupt received: EXITING')